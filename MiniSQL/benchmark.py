@@ -0,0 +1,231 @@
+######################################
+# MiniSQL - Benchmarks               #
+######################################
+
+# Library imports
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing
+import numpy as np
+from termcolor import colored
+from terminaltables import AsciiTable
+from columnStore import Column
+from joins import compareKeys
+import parallel
+from parallel import parallelFilter, parallelAggregate, parallelGroup
+from operators import Aggregate
+
+def generateTable(rows, seed=0):
+    """
+    A table of three columns : A uniform, B zipf skewed (few large groups), C small signed values.
+    """
+    rng = np.random.RandomState(seed)
+    return {'A': Column(rng.randint(0, 1000000, rows)),
+            'B': Column(np.minimum(rng.zipf(1.5, rows), 1000)),
+            'C': Column(rng.randint(-50, 50, rows))}
+
+def timed(func):
+    start = time.time()
+    func()
+    return time.time()-start
+
+def parallelScaling(rows=1 << 24, max_workers=None):
+    """
+    Time a filter, an aggregate and a GROUP BY over a generated table with 1, 2, 4, ... workers
+    and print the speedup of each over a single worker.
+    """
+    database = {'t': generateTable(rows)}
+    table = database['t']
+    predicate = lambda batch: compareKeys(table['C'].take(batch['t'])[0], '>', 0)
+    funcs = [('sum', 't', table['A']), ('max', 't', table['C']), ('count', 't', None)]
+    keys = [('t', table['B'])]
+    queries = [
+        ('filter C>0', lambda: sum(len(b['t']) for b in parallelFilter('t', [(0, rows)], predicate))),
+        ('sum, max, count where C>0', lambda: list(parallelAggregate('t', [(0, rows)], predicate, funcs, [Aggregate(f) for f, t, c in funcs]))),
+        ('group by B where C>0', lambda: list(parallelGroup('t', [(0, rows)], predicate, keys, funcs, [('key', 0), ('agg', 0), ('agg', 2)]))),
+    ]
+    max_workers = max_workers or multiprocessing.cpu_count()
+    counts = [1]
+    while counts[-1]*2 <= max_workers:
+        counts.append(counts[-1]*2)
+    if counts[-1]!=max_workers:
+        counts.append(max_workers)
+    table_rows = []
+    for name, query in queries:
+        base = None
+        for workers in counts:
+            parallel.setWorkers(workers)
+            seconds = timed(query)
+            base = base or seconds
+            table_rows.append([name, workers, '%.3f' % seconds, '%.0f' % (rows/seconds), '%.2fx' % (base/seconds)])
+    print colored("Parallel scaling over %s rows" % rows, 'green')
+    print AsciiTable([['query','workers','seconds','rows/sec','speedup']]+table_rows).table
+
+# Rows formatted per write while generating CSV files.
+CSV_CHUNK = 100000
+
+def skewedKeys(rng, rows, keys, skew):
+    """
+    rows keys drawn from keys distinct values, the i-th most frequent with weight 1/i^skew
+    (0 is uniform).
+    """
+    weights = 1.0/np.arange(1, keys+1)**skew
+    return rng.choice(keys, rows, p=weights/weights.sum())
+
+def writeCsv(path, header, columns):
+    """
+    Write integer columns as a table CSV file with its header row.
+    """
+    matrix = np.column_stack(columns)
+    line = ','.join(['%d']*len(header))+'\n'
+    with open(path, 'w') as f:
+        f.write(','.join(header)+'\n')
+        for start in xrange(0, len(matrix), CSV_CHUNK):
+            chunk = matrix[start:start+CSV_CHUNK]
+            f.write(line*len(chunk) % tuple(chunk.ravel().tolist()))
+
+def generateDatabase(path, rows, skew=1.0, keys=10000, seed=0):
+    """
+    Write a database directory (metadata.txt plus one CSV per table) : facts(id, k, v, w) with
+    rows rows and k skewed over keys values, and dims(k, d) with one row per key.
+    """
+    rng = np.random.RandomState(seed)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    with open(path+'/metadata.txt', 'w') as f:
+        for name, cols in [('facts', ['id','k','v','w']), ('dims', ['k','d'])]:
+            f.write('<begin_table>\n%s\n%s\n<end_table>\n' % (name, '\n'.join(cols)))
+    writeCsv(path+'/facts.csv', ['id','k','v','w'],
+             [np.arange(rows), skewedKeys(rng, rows, keys, skew), rng.randint(0, 1000000, rows), rng.randint(-100, 100, rows)])
+    writeCsv(path+'/dims.csv', ['k','d'], [np.arange(keys), rng.randint(0, 100, keys)])
+
+def workloads(rows, repeat, rng):
+    """
+    The timed statements : (name, rows each one processes, list of statements). Literals vary
+    between repetitions like they would between real queries.
+    """
+    pick = lambda high: [int(x) for x in rng.randint(0, high, repeat)]
+    ids = rng.choice(rows, min(repeat, rows), replace=False)
+    return [
+        ('select_and', rows, ["select id, v from facts where k = %d and v > %d" % (k, v) for k, v in zip(pick(100), pick(1000000))]),
+        ('select_or', rows, ["select id from facts where v < %d or w = %d" % (v, w) for v, w in zip(pick(1000), pick(200))]),
+        ('aggregate', rows, ["select count(*), sum(v), max(w), avg(v) from facts where v > %d" % v for v in pick(1000000)]),
+        ('group_by', rows, ["select k, count(*), sum(w) from facts where w > %d group by k" % w for w in pick(100)]),
+        ('insert', 1, ["insert into facts values (%d, %d, %d, %d)" % (rows+i, k, v, 0) for i, (k, v) in enumerate(zip(pick(10000), pick(1000000)))]),
+        ('delete', rows, ["delete from facts where id = %d" % i for i in ids]),
+    ]
+
+def timeStatements(run, statements, rows):
+    """
+    Run statements one by one. Returns their count, total seconds, throughput and latency percentiles.
+    """
+    latencies = []
+    for query in statements:
+        start = time.time()
+        run(query)
+        latencies.append(time.time()-start)
+    return summarize(latencies, rows)
+
+def summarize(latencies, rows):
+    total = sum(latencies)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])*1000
+    return {'count': len(latencies), 'seconds': round(total, 6),
+            'ops_per_sec': round(len(latencies)/total, 3) if total else None,
+            'rows_per_sec': round(rows*len(latencies)/total, 1) if total else None,
+            'p50_ms': round(p50, 3), 'p95_ms': round(p95, 3), 'p99_ms': round(p99, 3)}
+
+def benchmarkSize(path, rows, skew, repeat, seed, results):
+    """
+    Time every workload on the generated database at path and put the report in results.
+    Runs in its own process so peak RSS belongs to this size alone.
+    """
+    from miniSql import Database
+    try:
+        report = {'rows': rows, 'skew': skew, 'workloads': {}}
+        start = time.time()
+        database = Database(path)
+        report['workloads']['load'] = summarize([time.time()-start], rows)
+        for name, work_rows, statements in workloads(rows, repeat, np.random.RandomState(seed+1)):
+            report['workloads'][name] = timeStatements(database.execute, statements, work_rows)
+        database.close()
+        report['workloads']['rebase'] = timeStatements(database.execute, ['rebase data'], rows)
+        database.close()
+        # ru_maxrss is in kilobytes on Linux.
+        report['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0, 1)
+        results.put(report)
+    except Exception as e:
+        results.put({'rows': rows, 'skew': skew, 'error': '%s: %s' % (type(e).__name__, e)})
+
+def benchmarkSuite(sizes, skew=1.0, repeat=20, seed=0):
+    """
+    Run the benchmark at every size, each in a fresh process. The data is generated beforehand
+    by another process, so it counts neither in the timings nor in the peak RSS. Returns the
+    JSON report.
+    """
+    reports = []
+    for rows in sizes:
+        path = tempfile.mkdtemp(prefix='minisql-bench-')
+        try:
+            start = time.time()
+            generator = multiprocessing.Process(target=generateDatabase, args=(path, rows, skew), kwargs={'seed': seed})
+            generator.start()
+            generator.join()
+            if generator.exitcode:
+                reports.append({'rows': rows, 'skew': skew, 'error': 'Generating the database failed'})
+                continue
+            generate_seconds = round(time.time()-start, 3)
+            results = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=benchmarkSize, args=(path, rows, skew, repeat, seed, results))
+            worker.start()
+            report = results.get()
+            worker.join()
+            if 'error' not in report:
+                report['generate_seconds'] = generate_seconds
+            reports.append(report)
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+    return {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version.split()[0],
+            'numpy': np.__version__, 'workers': parallel.WORKERS, 'repeat': repeat, 'sizes': reports}
+
+def main():
+    parser = argparse.ArgumentParser(description='MiniSQL benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    suite = commands.add_parser('suite', help='time load, queries, DML and rebase on generated data, report JSON')
+    suite.add_argument('--rows', default='10000,100000,1000000', help='comma separated table sizes (up to 10000000)')
+    suite.add_argument('--skew', type=float, default=1.0, help='zipf exponent of the key column, 0 is uniform')
+    suite.add_argument('--repeat', type=int, default=20, help='statements timed per workload')
+    suite.add_argument('--seed', type=int, default=0)
+    suite.add_argument('--output', help='JSON report file, stdout when omitted')
+    generate = commands.add_parser('generate', help='write a generated database directory')
+    generate.add_argument('path')
+    generate.add_argument('--rows', type=int, default=100000)
+    generate.add_argument('--skew', type=float, default=1.0)
+    generate.add_argument('--seed', type=int, default=0)
+    scaling = commands.add_parser('parallel', help='speedup of parallel operators with 1, 2, 4, ... workers')
+    scaling.add_argument('--rows', type=int, default=1 << 24)
+    scaling.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command=='suite':
+        report = benchmarkSuite([int(x) for x in args.rows.split(',')], args.skew, args.repeat, args.seed)
+        text = json.dumps(report, indent=2, sort_keys=True)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(text+'\n')
+            print colored("[DONE]",'yellow'),"Report written to %s" % args.output
+        else:
+            print text
+    elif args.command=='generate':
+        generateDatabase(args.path, args.rows, args.skew, seed=args.seed)
+        print colored("[DONE]",'yellow'),"Generated %s rows in %s" % (args.rows, args.path)
+    else:
+        parallelScaling(args.rows, args.workers)
+
+if __name__=='__main__':
+    main()
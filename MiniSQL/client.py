@@ -0,0 +1,128 @@
+######################################
+# MiniSQL - Client library           #
+######################################
+
+# Library imports
+import json
+import socket
+import struct
+import threading
+from contextlib import contextmanager
+from results import Result, QueryError
+
+DEFAULT_PORT = 6543
+# Every message is a JSON document prefixed by its length as a 4 byte big-endian integer.
+HEADER = struct.Struct('>I')
+MAX_MESSAGE = 1 << 30
+
+def sendMessage(sock, message):
+    data = json.dumps(message, default=lambda x: x.item() if hasattr(x, 'item') else str(x))
+    sock.sendall(HEADER.pack(len(data))+data)
+
+def receiveExactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+def receiveMessage(sock):
+    """
+    Read one message, None once the peer closed the connection.
+    """
+    header = receiveExactly(sock, HEADER.size)
+    if header is None:
+        return None
+    size = HEADER.unpack(header)[0]
+    if size > MAX_MESSAGE:
+        raise IOError("Message of %s bytes is too large" % size)
+    data = receiveExactly(sock, size)
+    if data is None:
+        return None
+    return json.loads(data)
+
+def connect(address):
+    """
+    Open a socket to a server at a (host, port) pair or a Unix socket path.
+    """
+    if isinstance(address, tuple):
+        return socket.create_connection(address)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+class Connection(object):
+    """
+    One session with a server, running one statement at a time. Raises QueryError for
+    statements the server rejects.
+    """
+    def __init__(self, address=('localhost', DEFAULT_PORT)):
+        self.address = address
+        self.sock = connect(address)
+
+    def execute(self, query):
+        if self.sock is None:
+            raise IOError("Connection is closed")
+        sendMessage(self.sock, {'query': query})
+        reply = receiveMessage(self.sock)
+        if reply is None:
+            self.close()
+            raise IOError("Server closed the connection")
+        if reply['status']=='error':
+            raise QueryError(reply.get('error', 'Query failed'), reply.get('messages', ''))
+        return Result(reply)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+class ConnectionPool(object):
+    """
+    Up to size connections to one server, opened on demand and reused by the threads of a client.
+    A connection whose statement the server rejected goes back to the pool, one that fails in any
+    other way is discarded.
+    """
+    def __init__(self, address=('localhost', DEFAULT_PORT), size=8):
+        self.address = address
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        self.slots.acquire()
+        try:
+            with self.lock:
+                conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                conn = Connection(self.address)
+            try:
+                yield conn
+            except QueryError:
+                self.release(conn)
+                raise
+            except:
+                conn.close()
+                raise
+            self.release(conn)
+        finally:
+            self.slots.release()
+
+    def release(self, conn):
+        if conn.sock is not None:
+            with self.lock:
+                self.idle.append(conn)
+
+    def execute(self, query):
+        with self.connection() as conn:
+            return conn.execute(query)
+
+    def close(self):
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle = []
@@ -0,0 +1,666 @@
+######################################
+# MiniSQL - Columnar storage engine  #
+######################################
+
+# Library imports
+import os
+import csv
+import json
+import struct
+import numpy as np
+
+# Column types of a schema. Columns without a type in metadata.txt are BIGINT.
+COLUMN_KINDS = ['INT','BIGINT','TEXT']
+DEFAULT_KIND = 'BIGINT'
+INT_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+INT32 = np.iinfo(np.int32)
+
+def narrowDtype(low, high):
+    """
+    Smallest integer dtype holding every value between low and high.
+    """
+    for dtype in INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def valuesDtype(values):
+    return narrowDtype(int(values.min()), int(values.max())) if len(values) else np.dtype(np.int8)
+
+def setBits(bitmap, start, bits):
+    """
+    Write the booleans bits into a packed bitmap from bit start on.
+    """
+    lo, hi = start >> 3, (start+len(bits)+7) >> 3
+    unpacked = np.unpackbits(bitmap[lo:hi])
+    unpacked[start-lo*8:start-lo*8+len(bits)] = bits
+    bitmap[lo:hi] = np.packbits(unpacked)
+
+class Column(object):
+    """
+    A typed column : a contiguous buffer of the narrowest integer type holding its values, plus a
+    packed validity bitmap (one bit per row) marking NULLs. Columns without NULLs keep no bitmap.
+    """
+    def __init__(self, values=None, valid=None, kind=DEFAULT_KIND):
+        if values is None:
+            values = np.zeros(0, dtype=np.int8)
+        # Buffers may be longer than the column (spare capacity for appends)
+        # or read-only memory maps, self.size is the number of rows in use.
+        self._values = np.asarray(values)
+        if self._values.dtype.kind!='i':
+            self._values = self._values.astype(np.int64)
+        self.size = len(self._values)
+        self._bitmap = None
+        if valid is not None and not np.all(valid):
+            self._bitmap = np.packbits(np.asarray(valid, dtype=np.bool_))
+        self.kind = kind
+        # Secondary indexes over this column, by name.
+        self.indexes = {}
+        # Planner statistics, gathered on first use and maintained on every change.
+        self.stats = None
+        # Per block min/max summary used to skip blocks while scanning.
+        self.zones = None
+
+    @property
+    def values(self):
+        return self._values[:self.size]
+
+    @property
+    def valid(self):
+        if self._bitmap is None:
+            return np.ones(self.size, dtype=np.bool_)
+        return np.unpackbits(self._bitmap)[:self.size].view(np.bool_)
+
+    def __len__(self):
+        return self.size
+
+    def compact(self):
+        """
+        Store the values with the narrowest integer type holding them, dropping spare capacity.
+        """
+        values = self.values
+        self._values = values.astype(valuesDtype(values[self.valid]))
+        return self
+
+    def append(self, values, valid):
+        """
+        Append rows in place. Buffers grow geometrically so appends cost O(rows appended) amortized,
+        memory mapped buffers are copied to memory on the first write. Values too wide for the buffer
+        widen it.
+        """
+        n = len(values)
+        values = np.asarray(values)
+        valid = np.asarray(valid, dtype=np.bool_)
+        present = valid.all()
+        dtype = np.promote_types(self._values.dtype, valuesDtype(values if present else values[valid]))
+        if self.size+n > len(self._values) or not self._values.flags.writeable or dtype!=self._values.dtype:
+            capacity = max(16, 2*(self.size+n))
+            new_values = np.zeros(capacity, dtype=dtype)
+            new_values[:self.size] = self.values
+            self._values = new_values
+        self._values[self.size:self.size+n] = values if present else np.where(valid, values, 0)
+        if self._bitmap is not None or not present:
+            need = (self.size+n+7) >> 3
+            if self._bitmap is None:
+                self._bitmap = np.full(max(need, (len(self._values)+7) >> 3), 255, dtype=np.uint8)
+            elif need > len(self._bitmap) or not self._bitmap.flags.writeable:
+                grown = np.full(max(need, 2*len(self._bitmap)), 255, dtype=np.uint8)
+                grown[:len(self._bitmap)] = self._bitmap
+                self._bitmap = grown
+            setBits(self._bitmap, self.size, valid)
+        rows = np.arange(self.size, self.size+n)
+        self.size += n
+        for index in self.indexes.values():
+            index.insertRows(rows, values.astype(np.int64), valid)
+        if self.stats is not None:
+            self.stats.insertRows(values, valid)
+        if self.zones is not None:
+            self.zones.appended(self)
+
+    def appendCells(self, cells):
+        """
+        Parse string cells and append them. Returns the cells that failed to parse and were stored as NULL.
+        """
+        new, failed = columnFromStrings(cells, self.kind)
+        self.append(new.values, new.valid)
+        return failed
+
+    def delete(self, keep):
+        """
+        Drop every row whose entry in the boolean mask keep is False.
+        """
+        valid = self.valid[keep]
+        self._values = self.values[keep]
+        self._bitmap = None if valid.all() else np.packbits(valid)
+        self.size = len(self._values)
+        for index in self.indexes.values():
+            index.deleteRows(keep)
+        if self.stats is not None:
+            self.stats.deleteRows(self)
+        if self.zones is not None:
+            self.zones.deleted(self)
+
+    def __getitem__(self, i):
+        values, valid = self.take(np.array([i]))
+        if not valid[0]:
+            return None
+        return self.decode(int(values[0]))
+
+    def __repr__(self):
+        return repr(self.toList())
+
+    def take(self, rows=None):
+        """
+        Gather the values and validity of the given rows (all rows if None).
+        """
+        if rows is None:
+            return self.values, self.valid
+        rows = np.asarray(rows)
+        if self._bitmap is None:
+            return self.values[rows], np.ones(len(rows), dtype=np.bool_)
+        bits = (self._bitmap[rows >> 3] >> (7-(rows & 7)).astype(np.uint8)) & 1
+        return self.values[rows], bits.view(np.bool_)
+
+    def slice(self, start, stop=None):
+        """
+        Values and validity of the rows from start to stop (the end if None), as views where possible.
+        """
+        values = self.values[start:stop]
+        if self._bitmap is None:
+            return values, np.ones(len(values), dtype=np.bool_)
+        lo = start >> 3
+        bits = np.unpackbits(self._bitmap[lo:(start+len(values)+7) >> 3])
+        return values, bits[start-lo*8:start-lo*8+len(values)].view(np.bool_)
+
+    def compare(self, delim, value, rows=None):
+        """
+        Evaluate `column <delim> value` over the given rows into a boolean mask. NULLs never match.
+        """
+        values, valid = self.take(rows)
+        if delim=='=':
+            mask = values == value
+        elif delim=='>':
+            mask = values > value
+        elif delim=='<':
+            mask = values < value
+        else:
+            raise ValueError("Unsupported operator %s" % delim)
+        return mask & valid
+
+    def decode(self, value):
+        """
+        Turn a value computed over the column (e.g. an aggregate result) into what the column holds.
+        """
+        return value
+
+    def toList(self, rows=None):
+        """
+        Materialize the given rows as python values, NULLs as None.
+        """
+        values, valid = self.take(rows)
+        out = values.tolist()
+        if not valid.all():
+            for i in np.flatnonzero(~valid):
+                out[i] = None
+        return out
+
+    def cells(self, rows=None):
+        """
+        The given rows as cells that parse back to the same values, NULLs as None.
+        """
+        return self.toList(rows)
+
+class Code(int):
+    """
+    Dictionary code a text literal of a condition stands for. Prints as the literal.
+    """
+    def __new__(cls, code, literal):
+        code = int.__new__(cls, code)
+        code.literal = literal
+        return code
+
+    def __str__(self):
+        return "'%s'" % self.literal
+
+    __repr__ = __str__
+
+class Text(object):
+    """
+    Quoted literal of a condition, bound to a dictionary code once its column is known.
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return "'%s'" % self.value
+
+    __repr__ = __str__
+
+def unquoteCell(cell):
+    if len(cell) > 1 and cell[0]==cell[-1] and cell[0] in '\'"':
+        return cell[1:-1]
+    return cell
+
+def encodeStrings(cells):
+    """
+    Dictionary encode text cells : returns the sorted distinct strings, the code of every cell
+    (its position in them) and the validity. None and cells reading NULL are NULLs, quotes are removed.
+    """
+    first = {}
+    codes = []
+    valid = []
+    for cell in cells:
+        # Rows replayed from the write-ahead log come back from JSON as unicode.
+        if isinstance(cell, unicode):
+            cell = cell.encode('utf8')
+        cell = cell.strip() if cell is not None else 'NULL'
+        if cell.upper()=='NULL':
+            codes.append(0)
+            valid.append(False)
+            continue
+        codes.append(first.setdefault(unquoteCell(cell), len(first)))
+        valid.append(True)
+    dictionary = sorted(first)
+    # Codes were handed out in order of appearance, rank them by string order.
+    rank = np.zeros(max(len(first), 1), dtype=np.int64)
+    rank[[first[x] for x in dictionary]] = np.arange(len(dictionary))
+    valid = np.array(valid, dtype=np.bool_)
+    codes = np.where(valid, rank[np.array(codes, dtype=np.int64)], 0) if len(cells) else np.zeros(0, dtype=np.int64)
+    return np.array(dictionary, dtype=object), codes, valid
+
+def translateCodes(codes, remap):
+    """
+    Map codes through remap (old code -> new code). NULL slots may hold any code.
+    """
+    if not len(remap):
+        return np.zeros(len(codes), dtype=np.int64)
+    return remap[np.minimum(codes, len(remap)-1)]
+
+class TextColumn(Column):
+    """
+    A dictionary encoded TEXT column : the sorted distinct strings, and for every row the code of
+    its string (its position in the dictionary). Codes follow string order, so comparisons with a
+    literal run on the codes once the literal is translated (see encodeLiteral).
+    """
+    def __init__(self, codes=None, valid=None, dictionary=None):
+        Column.__init__(self, codes, valid, 'TEXT')
+        self.dictionary = np.array([] if dictionary is None else list(dictionary), dtype=object)
+
+    def appendCells(self, cells):
+        dictionary, codes, valid = encodeStrings(cells)
+        self.appendEncoded(dictionary, codes, valid)
+        return []
+
+    def appendEncoded(self, dictionary, codes, valid):
+        """
+        Append rows encoded against another dictionary. Strings new to this column are merged into
+        its dictionary, which renumbers the existing rows : their indexes, statistics and zone maps
+        are rebuilt.
+        """
+        pos = np.searchsorted(self.dictionary, dictionary)
+        known = pos < len(self.dictionary)
+        known[known] = self.dictionary[pos[known]]==dictionary[known]
+        if not known.all():
+            self.extendDictionary(dictionary[~known])
+        remap = np.searchsorted(self.dictionary, dictionary)
+        Column.append(self, translateCodes(codes, remap), valid)
+
+    def extendDictionary(self, strings):
+        from indexes import buildIndex
+        merged = np.union1d(self.dictionary, strings)
+        values = translateCodes(self.values, np.searchsorted(merged, self.dictionary))
+        self._values = values.astype(narrowDtype(0, len(merged)))
+        self.dictionary = merged
+        for name, index in self.indexes.items():
+            self.indexes[name] = buildIndex(index.name, index.table, index.col, index.kind, self)
+        self.stats = None
+        if self.zones is not None:
+            self.zones.deleted(self)
+
+    def encodeLiteral(self, delim, literal):
+        """
+        The code to compare the codes with for `column <delim> literal` : the literal's code for =
+        (-1, matching nothing, if it is absent), the bound below or above it for < and >.
+        """
+        if delim=='=':
+            code = np.searchsorted(self.dictionary, literal)
+            if code==len(self.dictionary) or self.dictionary[code]!=literal:
+                code = -1
+        elif delim=='<':
+            code = np.searchsorted(self.dictionary, literal, 'left')
+        else:
+            code = np.searchsorted(self.dictionary, literal, 'right')-1
+        return Code(int(code), literal)
+
+    def decode(self, value):
+        if isinstance(value, list):
+            return [self.dictionary[x] for x in value]
+        if value is None:
+            return value
+        return self.dictionary[value]
+
+    def toList(self, rows=None):
+        values, valid = self.take(rows)
+        if not len(self.dictionary):
+            return [None]*len(values)
+        out = self.dictionary[translateCodes(values, np.arange(len(self.dictionary)))].tolist()
+        if not valid.all():
+            for i in np.flatnonzero(~valid):
+                out[i] = None
+        return out
+
+    def cells(self, rows=None):
+        # Strings reading as NULL or quoted are quoted once more, so they parse back unchanged.
+        return [x if x is None or (x.strip().upper()!='NULL' and unquoteCell(x.strip())==x.strip()) else "'%s'" % x
+                for x in self.toList(rows)]
+
+def newColumn(kind=DEFAULT_KIND):
+    """
+    An empty column of a schema type.
+    """
+    return TextColumn() if kind=='TEXT' else Column(kind=kind)
+
+def comparableValues(left, left_values, right, right_values):
+    """
+    Values of two columns made comparable with each other : the codes of two TEXT columns are
+    translated into the union of both dictionaries. Raises ValueError for TEXT against integers.
+    """
+    if left.kind!='TEXT' and right.kind!='TEXT':
+        return left_values, right_values
+    if left.kind!=right.kind:
+        raise ValueError("TEXT can only be compared with TEXT")
+    if left.dictionary is right.dictionary:
+        return left_values, right_values
+    union = np.union1d(left.dictionary, right.dictionary)
+    return (translateCodes(left_values, np.searchsorted(union, left.dictionary)),
+            translateCodes(right_values, np.searchsorted(union, right.dictionary)))
+
+def columnFromStrings(cells, kind=DEFAULT_KIND):
+    """
+    Build a column of the given type by parsing string cells. INT and BIGINT cells must be integers
+    in range, TEXT cells are dictionary encoded. Returns the column and the cells that failed.
+    """
+    if kind=='TEXT':
+        dictionary, codes, valid = encodeStrings(cells)
+        return TextColumn(codes, valid, dictionary), []
+    # Fast path : numpy parses a batch of clean integer cells in one call.
+    try:
+        values = np.array(cells).astype(np.int64) if len(cells) else np.zeros(0, dtype=np.int64)
+        if kind!='INT' or not len(values) or (values.min() >= INT32.min and values.max() <= INT32.max):
+            return Column(values, kind=kind), []
+    except (ValueError, TypeError, OverflowError):
+        pass
+    values = np.zeros(len(cells), dtype=np.int64)
+    valid = np.ones(len(cells), dtype=np.bool_)
+    failed = []
+    for i, cell in enumerate(cells):
+        try:
+            values[i] = int(cell)
+            if kind=='INT' and not INT32.min <= values[i] <= INT32.max:
+                raise OverflowError
+        except:
+            values[i] = 0
+            valid[i] = False
+            if cell is not None and cell.strip().upper()!='NULL':
+                failed.append(cell)
+    return Column(values, valid, kind), failed
+
+def appendRows(table, cols, rows):
+    """
+    Parse rows of string cells (in cols order) and append them to the in-memory table.
+    Returns the cells that failed to parse and were stored as NULL.
+    """
+    failed = []
+    for i, col in enumerate(cols):
+        failed += table[col].appendCells([row[i] for row in rows])
+    return failed
+
+# Rows per batch when bulk loading a CSV.
+BULK_BATCH = 100000
+
+def csvBatches(filename, cols, batch=BULK_BATCH):
+    """
+    Stream a CSV file as batches of rows in cols order. A header line naming the columns reorders them,
+    rows with the wrong number of cells are rejected. Yields (rows, rejected count) pairs.
+    """
+    with open(filename,'r') as f:
+        order = range(len(cols))
+        rows = []
+        rejected = 0
+        for i, row in enumerate(csv.reader(f, delimiter=',', skipinitialspace=True)):
+            if i==0 and sorted(x.strip() for x in row)==sorted(cols):
+                header = [x.strip() for x in row]
+                order = [header.index(col) for col in cols]
+                continue
+            if len(row)!=len(cols):
+                rejected += 1
+                continue
+            rows.append([row[j] for j in order])
+            if len(rows)>=batch:
+                yield rows, rejected
+                rows = []
+                rejected = 0
+        if rows or rejected:
+            yield rows, rejected
+
+def deleteRows(table, keep):
+    """
+    Remove from the in-memory table every row whose entry in the boolean mask keep is False.
+    """
+    for col in table:
+        table[col].delete(keep)
+
+# Binary table files (version 2) : magic, footer offset and footer length, then the
+# segments of every column (8 byte aligned), then the JSON footer describing them :
+# per column its name, type, dictionary (TEXT), encoding and the (offset, bytes, dtype)
+# of each segment. Packed validity bitmaps are only written for columns with NULLs.
+BINARY_MAGIC = 'MSQLTBL2'
+BINARY_EXT = '.mtbl'
+HEADER = struct.Struct('<8sqq')
+# Version 1 : magic, row count, column count, header length, the newline separated
+# column names, then one int64 segment per column and one validity byte segment per column.
+LEGACY_MAGIC = 'MSQLTBL1'
+LEGACY_HEADER = struct.Struct('<8sqqq')
+# A column is only stored with a compressed encoding (decoded when loading) if that takes
+# at most this fraction of the plain encoding, which stays memory mapped.
+ENCODED_FRACTION = 0.5
+# Rows bit-packed per chunk, a multiple of 8 so every chunk starts on a byte.
+BITPACK_ROWS = 65536
+
+def align(offset, boundary=8):
+    return (offset + boundary - 1) // boundary * boundary
+
+def isBinaryTable(path, t_name):
+    """
+    Check if a table is stored in the binary format rather than as a CSV.
+    """
+    return os.path.isfile(path+'/'+t_name+BINARY_EXT)
+
+def tableExists(path, t_name):
+    return os.path.isfile(path+'/'+t_name+'.csv') or isBinaryTable(path, t_name)
+
+def packBits(values, low, width):
+    """
+    Frame of reference bit-packing : every value minus low in width bits, BITPACK_ROWS rows per chunk.
+    """
+    shifts = np.arange(width, dtype=np.uint64)
+    parts = [np.zeros(0, dtype=np.uint8)]
+    for start in xrange(0, len(values), BITPACK_ROWS):
+        chunk = values[start:start+BITPACK_ROWS].astype(np.int64).view(np.uint64)-np.uint64(low % (1 << 64))
+        parts.append(np.packbits(((chunk[:, None] >> shifts) & np.uint64(1)).astype(np.uint8).ravel()))
+    return np.concatenate(parts)
+
+def unpackBits(data, low, width, rows):
+    shifts = np.arange(width, dtype=np.uint64)
+    out = np.zeros(rows, dtype=np.uint64)
+    step = BITPACK_ROWS*width // 8
+    for chunk, start in enumerate(xrange(0, rows, BITPACK_ROWS)):
+        n = min(BITPACK_ROWS, rows-start)
+        bits = np.unpackbits(data[chunk*step:chunk*step+(n*width+7) // 8])[:n*width].reshape(n, width)
+        out[start:start+n] = (bits.astype(np.uint64) << shifts).sum(axis=1, dtype=np.uint64)
+    return (out+np.uint64(low % (1 << 64))).view(np.int64)
+
+def encodeValues(values):
+    """
+    Pick the encoding of a column's values : plain (narrowest integer type), delta (first value
+    plus differences), run length (run values and lengths) or bit-packed (minimum plus offsets in
+    as few bits as they need). Returns (encoding, parameters, segments).
+    """
+    dtype = valuesDtype(values)
+    plain = ('plain', {}, [values.astype(dtype)])
+    if len(values) < 2:
+        return plain
+    candidates = []
+    diffs = np.diff(values.astype(np.int64))
+    candidates.append(('delta', {'base': int(values[0])}, [diffs.astype(valuesDtype(diffs))]))
+    starts = np.concatenate([[0], np.flatnonzero(values[1:]!=values[:-1])+1])
+    lengths = np.diff(np.append(starts, len(values)))
+    candidates.append(('rle', {}, [values[starts].astype(dtype), lengths.astype(valuesDtype(lengths))]))
+    low, high = int(values.min()), int(values.max())
+    width = (high-low).bit_length()
+    candidates.append(('bitpack', {'base': low, 'width': width}, [packBits(values, low, width)]))
+    size = lambda encoded: sum(segment.nbytes for segment in encoded[2])
+    best = min(candidates, key=size)
+    return best if size(best) <= ENCODED_FRACTION*size(plain) else plain
+
+def decodeValues(encoding, params, segments, rows, dtype):
+    if encoding=='plain':
+        return segments[0]
+    if encoding=='delta':
+        values = np.empty(rows, dtype=np.int64)
+        values[0] = params['base']
+        np.cumsum(segments[0], dtype=np.int64, out=values[1:])
+        values[1:] += params['base']
+    elif encoding=='rle':
+        values = np.repeat(segments[0], segments[1])
+    else:
+        values = unpackBits(segments[0], params['base'], params['width'], rows)
+    return values.astype(dtype)
+
+def loadBinaryTable(filename):
+    """
+    Load a binary table file. Returns the column names and a dict of columns. Plain segments are
+    memory mapped, so their pages are only read from disk when a query touches them, compressed
+    ones are decoded into memory.
+    """
+    with open(filename,'rb') as f:
+        magic = f.read(8)
+        f.seek(0)
+        if magic==LEGACY_MAGIC:
+            return loadLegacyTable(filename)
+        magic, footer_offset, footer_length = HEADER.unpack(f.read(HEADER.size))
+        if magic!=BINARY_MAGIC:
+            raise ValueError("%s is not a MiniSQL binary table" % filename)
+        f.seek(footer_offset)
+        footer = json.loads(f.read(footer_length))
+    nrows = footer['rows']
+    cols = []
+    columns = {}
+    for meta in footer['columns']:
+        col = meta['name'].encode('utf8')
+        cols.append(col)
+        if meta['kind']=='TEXT':
+            column = TextColumn(dictionary=[x.encode('utf8') for x in meta['dictionary']])
+        else:
+            column = Column(kind=meta['kind'])
+        if nrows:
+            segments = [np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(size // np.dtype(dtype).itemsize,))
+                        for offset, size, dtype in meta['segments']]
+            column._values = decodeValues(meta['encoding'], meta, segments, nrows, np.dtype(meta['dtype']))
+            column.size = nrows
+            if meta['nulls'] is not None:
+                column._bitmap = np.memmap(filename, dtype=np.uint8, mode='r', offset=meta['nulls'][0], shape=(meta['nulls'][1],))
+        columns[col] = column
+    return cols, columns
+
+def loadLegacyTable(filename):
+    """
+    Memory-map a version 1 binary table file, every column BIGINT.
+    """
+    with open(filename,'rb') as f:
+        magic, nrows, ncols, hlen = LEGACY_HEADER.unpack(f.read(LEGACY_HEADER.size))
+        cols = f.read(hlen).split('\n') if ncols else []
+    offset = align(LEGACY_HEADER.size+hlen)
+    columns = {}
+    for i, col in enumerate(cols):
+        if nrows:
+            values = np.memmap(filename, dtype=np.int64, mode='r', offset=offset+i*nrows*8, shape=(nrows,))
+            valid = np.memmap(filename, dtype=np.bool_, mode='r', offset=offset+ncols*nrows*8+i*nrows, shape=(nrows,))
+        else:
+            values, valid = [], None
+        columns[col] = Column(values, valid)
+    return cols, columns
+
+def writeBinaryTable(filename, cols, table, rows=None):
+    """
+    Write the given rows (all if None) of a table in the binary format, column by column.
+    """
+    footer = {'rows': 0, 'columns': []}
+    with open(filename,'wb') as f:
+        f.write(HEADER.pack(BINARY_MAGIC, 0, 0))
+        def write(array):
+            f.write('\0'*(align(f.tell())-f.tell()))
+            offset = f.tell()
+            array.tofile(f)
+            return [offset, array.nbytes, array.dtype.str]
+        for col in cols:
+            column = table[col]
+            values, valid = column.take(rows)
+            # NULL slots take a value of the column so they widen no encoding.
+            values = np.where(valid, values, values[valid].min() if valid.any() else 0)
+            encoding, params, segments = encodeValues(values)
+            meta = dict(params, name=col, kind=column.kind, encoding=encoding, dtype=valuesDtype(values).str)
+            meta['segments'] = [write(segment) for segment in segments]
+            meta['nulls'] = None if valid.all() else write(np.packbits(valid))[:2]
+            if column.kind=='TEXT':
+                meta['dictionary'] = column.dictionary.tolist()
+            footer['rows'] = len(values)
+            footer['columns'].append(meta)
+        footer = json.dumps(footer)
+        offset = f.tell()
+        f.write(footer)
+        f.seek(0)
+        f.write(HEADER.pack(BINARY_MAGIC, offset, len(footer)))
+        f.flush()
+        os.fsync(f.fileno())
+
+def writeCsvTable(filename, cols, table, rows=None):
+    """
+    Write the given rows (all if None) of a table as a CSV with a header line.
+    """
+    with open(filename,'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(cols)
+        col_values = [table[col].cells(rows) for col in cols]
+        writer.writerows(["NULL" if x is None else x for x in row] for row in zip(*col_values))
+        f.flush()
+        os.fsync(f.fileno())
+
+def stageTable(path, t_name, table, rows=None):
+    """
+    Write the given rows (all if None) of a table next to its file, keeping its storage format.
+    Returns the (staged, final) file names, renaming one over the other installs it.
+    """
+    cols = sorted(table.keys())
+    if isBinaryTable(path, t_name):
+        final = path+'/'+t_name+BINARY_EXT
+        writeBinaryTable(final+'.tmp', cols, table, rows)
+    else:
+        final = path+'/'+t_name+'.csv'
+        writeCsvTable(final+'.tmp', cols, table, rows)
+    return final+'.tmp', final
+
+def convertTable(path, t_name, cols, table, fmt):
+    """
+    Move a table between the CSV layout ('csv') and the binary format ('binary').
+    """
+    if fmt=='binary':
+        writeBinaryTable(path+'/'+t_name+BINARY_EXT+'.tmp', cols, table)
+        os.rename(path+'/'+t_name+BINARY_EXT+'.tmp', path+'/'+t_name+BINARY_EXT)
+        if os.path.isfile(path+'/'+t_name+'.csv'):
+            os.remove(path+'/'+t_name+'.csv')
+    else:
+        writeCsvTable(path+'/'+t_name+'.csv', cols, table)
+        if isBinaryTable(path, t_name):
+            os.remove(path+'/'+t_name+BINARY_EXT)
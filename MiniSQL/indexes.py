@@ -0,0 +1,208 @@
+######################################
+# MiniSQL - Secondary indexes        #
+######################################
+
+# Library imports
+import os
+import numpy as np
+
+INDEX_FILE = 'indexes.txt'
+
+class SortedIndex(object):
+    """
+    Sorted (B-tree style) index : the row ids of a column ordered by value.
+    Serves point and range lookups with binary search.
+    """
+    kind = 'btree'
+
+    def __init__(self, name, table, col, order, column):
+        self.name = name
+        self.table = table
+        self.col = col
+        self.order = order
+        self.keys = column.values[order].astype(np.int64)
+
+    def lookup(self, delim, value):
+        """
+        Row ids (ascending) whose value satisfies `col <delim> value`.
+        """
+        if delim=='=':
+            lo = np.searchsorted(self.keys, value, 'left')
+            hi = np.searchsorted(self.keys, value, 'right')
+        elif delim=='<':
+            lo, hi = 0, np.searchsorted(self.keys, value, 'left')
+        elif delim=='>':
+            lo, hi = np.searchsorted(self.keys, value, 'right'), len(self.keys)
+        else:
+            raise ValueError("Unsupported operator %s" % delim)
+        return np.sort(self.order[lo:hi])
+
+    def supports(self, delim):
+        return delim in ['=','<','>']
+
+    def insertRows(self, rows, values, valid):
+        """
+        Merge newly appended rows into the sorted order.
+        """
+        rows, values = rows[valid], values[valid]
+        sort = np.argsort(values, kind='mergesort')
+        rows, values = rows[sort], values[sort]
+        pos = np.searchsorted(self.keys, values, 'right')
+        self.keys = np.insert(self.keys, pos, values)
+        self.order = np.insert(self.order, pos, rows)
+
+    def deleteRows(self, keep):
+        """
+        Drop deleted rows from the order and renumber the surviving row ids.
+        """
+        remap = np.cumsum(keep) - 1
+        alive = keep[self.order]
+        self.order = remap[self.order[alive]]
+        self.keys = self.keys[alive]
+
+class HashIndex(object):
+    """
+    Hash index : a dict from each value to its slot, and per slot a run of ascending row ids in
+    order. Serves point lookups only, with one dict probe. Slots of values that were deleted stay
+    behind with no rows.
+    """
+    kind = 'hash'
+
+    def __init__(self, name, table, col, order, column):
+        self.name = name
+        self.table = table
+        self.col = col
+        keys = column.values[order].astype(np.int64)
+        sort = np.argsort(keys, kind='mergesort')
+        self.order = order[sort]
+        values, self.counts = np.unique(keys[sort], return_counts=True)
+        self.slots = dict(zip(values.tolist(), range(len(values))))
+        self.starts = runStarts(self.counts)
+
+    def lookup(self, delim, value):
+        if delim!='=':
+            raise ValueError("Hash index %s only serves = lookups" % self.name)
+        slot = self.slots.get(value)
+        if slot is None:
+            return self.order[:0]
+        return self.order[self.starts[slot]:self.starts[slot]+self.counts[slot]]
+
+    def supports(self, delim):
+        return delim=='='
+
+    def insertRows(self, rows, values, valid):
+        """
+        Add newly appended rows at the end of the runs of their values, new values get new slots.
+        """
+        rows, values = rows[valid], values[valid]
+        if not len(rows):
+            return
+        distinct, inverse = np.unique(values, return_inverse=True)
+        slots = np.array([self.slots.setdefault(value, len(self.slots)) for value in distinct.tolist()])[inverse]
+        sort = np.argsort(slots, kind='mergesort')
+        rows, slots = rows[sort], slots[sort]
+        counts = np.concatenate([self.counts, np.zeros(len(self.slots)-len(self.counts), dtype=self.counts.dtype)])
+        starts = runStarts(counts)
+        self.order = np.insert(self.order, starts[slots]+counts[slots], rows)
+        self.counts = counts + np.bincount(slots, minlength=len(counts))
+        self.starts = runStarts(self.counts)
+
+    def deleteRows(self, keep):
+        """
+        Drop deleted rows from their runs and renumber the surviving row ids.
+        """
+        alive = keep[self.order]
+        slots = np.repeat(np.arange(len(self.counts)), self.counts)
+        self.counts = np.bincount(slots[alive], minlength=len(self.counts))
+        self.order = (np.cumsum(keep) - 1)[self.order[alive]]
+        self.starts = runStarts(self.counts)
+
+def runStarts(counts):
+    """
+    Offsets of consecutive runs with the given lengths.
+    """
+    return np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+
+INDEX_KINDS = {'btree': SortedIndex, 'hash': HashIndex}
+
+def sortColumn(column):
+    """
+    Row ids of the non-NULL values of a column in ascending value order.
+    """
+    rows = np.flatnonzero(column.valid)
+    return rows[np.argsort(column.values[rows], kind='mergesort')]
+
+def buildIndex(name, table, col, kind, column):
+    """
+    Build an index of the given kind over a column.
+    """
+    return INDEX_KINDS[kind](name, table, col, sortColumn(column), column)
+
+def readIndexDefinitions(path):
+    """
+    Read the (name, table, column, kind) definitions listed in the index file of a database.
+    """
+    if not os.path.isfile(path+'/'+INDEX_FILE):
+        return []
+    with open(path+'/'+INDEX_FILE,'r') as f:
+        lines = f.read().splitlines()
+    definitions = []
+    for i, line in enumerate(lines):
+        if line=='<begin_index>':
+            definitions.append(tuple(lines[i+1:i+5]))
+    return definitions
+
+def writeIndexDefinitions(path, definitions):
+    """
+    Rewrite the index file of a database from a list of (name, table, column, kind) definitions.
+    """
+    with open(path+'/'+INDEX_FILE,'w') as f:
+        for definition in definitions:
+            f.write('<begin_index>\n')
+            for field in definition:
+                f.write(field+'\n')
+            f.write('<end_index>\n')
+
+def saveIndex(path, index):
+    """
+    Persist the sorted row order of an index next to the table files.
+    """
+    with open(path+'/'+index.name+'.idx','wb') as f:
+        np.save(f, index.order)
+
+def loadIndexes(path, database):
+    """
+    Attach every index defined for the database to its column. Persisted orders are reused when they
+    still cover the column, otherwise the index is rebuilt and saved again.
+    """
+    for name, table, col, kind in readIndexDefinitions(path):
+        if table not in database or col not in database[table]:
+            continue
+        column = database[table][col]
+        order = None
+        if os.path.isfile(path+'/'+name+'.idx'):
+            with open(path+'/'+name+'.idx','rb') as f:
+                order = np.load(f)
+            if len(order)!=int(column.valid.sum()) or (len(order) and order.max() >= len(column)):
+                order = None
+        if order is None:
+            index = buildIndex(name, table, col, kind, column)
+            saveIndex(path, index)
+        else:
+            index = INDEX_KINDS[kind](name, table, col, order, column)
+        column.indexes[name] = index
+
+def invalidateIndexes(path, table):
+    """
+    Remove the persisted orders of a table's indexes after its data changed, they are rebuilt on load.
+    """
+    for name, t_name, col, kind in readIndexDefinitions(path):
+        if t_name==table and os.path.isfile(path+'/'+name+'.idx'):
+            os.remove(path+'/'+name+'.idx')
+
+def dropIndexes(path, table):
+    """
+    Forget every index of a dropped table.
+    """
+    invalidateIndexes(path, table)
+    writeIndexDefinitions(path, [d for d in readIndexDefinitions(path) if d[1]!=table])
@@ -0,0 +1,222 @@
+######################################
+# MiniSQL - Join operators           #
+######################################
+
+# Library imports
+import numpy as np
+from parallel import useParallel, parallelProbe
+from columnStore import comparableValues
+from operators import scanRelation, batchLength
+
+# Largest build side for which a hash table is built, above it we sort-merge.
+HASH_BUILD_LIMIT = 1 << 16
+# Row pairs compared per nested loop chunk, bounds the memory held whatever the input sizes.
+NESTED_LOOP_PAIRS = 1 << 20
+
+def isSorted(keys):
+    """
+    Check if an array of join keys is already in ascending order.
+    """
+    return len(keys) < 2 or bool((keys[1:] >= keys[:-1]).all())
+
+def chooseJoin(left_count, right_count, left_sorted=False, right_sorted=False):
+    """
+    Pick the algorithm of an equality join from the input cardinalities. Joins without an
+    equality predicate always use the nested loop.
+    """
+    if left_sorted and right_sorted:
+        return 'merge'
+    if min(left_count, right_count) <= HASH_BUILD_LIMIT:
+        return 'hash'
+    return 'merge'
+
+def hashJoin(left_keys, right_keys):
+    """
+    Equi-join two key arrays by building a hash table on the smaller side and probing it with the other.
+    Returns the matching (left positions, right positions).
+    """
+    swap = len(left_keys) > len(right_keys)
+    build, probe = (right_keys, left_keys) if swap else (left_keys, right_keys)
+    table = buildHashTable(build)
+    # Large probe sides are split between the worker processes, which inherit the hash table.
+    if useParallel(len(probe)):
+        build_pos, probe_pos = parallelProbe(table, probe)
+    else:
+        build_pos, probe_pos = probeHashTable(table, probe)
+    if swap:
+        return probe_pos, build_pos
+    return build_pos, probe_pos
+
+def buildHashTable(keys):
+    """
+    Map every key to the positions holding it.
+    """
+    table = {}
+    for i, key in enumerate(keys.tolist()):
+        table.setdefault(key, []).append(i)
+    return table
+
+def probeHashTable(table, probe):
+    """
+    Look every probe key up in a hash table. Returns the matching (build positions, probe positions).
+    """
+    build_pos = []
+    probe_pos = []
+    for j, key in enumerate(probe.tolist()):
+        matches = table.get(key)
+        if matches:
+            build_pos.extend(matches)
+            probe_pos.extend([j]*len(matches))
+    return np.array(build_pos, dtype=np.int64), np.array(probe_pos, dtype=np.int64)
+
+def mergeJoin(left_keys, right_keys, left_sorted=False, right_sorted=False):
+    """
+    Equi-join two key arrays by sorting them (unless already sorted) and merging the runs of equal keys.
+    Returns the matching (left positions, right positions).
+    """
+    left_order = np.arange(len(left_keys)) if left_sorted else np.argsort(left_keys, kind='mergesort')
+    right_order = np.arange(len(right_keys)) if right_sorted else np.argsort(right_keys, kind='mergesort')
+    left_keys = left_keys[left_order]
+    right_keys = right_keys[right_order]
+    start = np.searchsorted(right_keys, left_keys, 'left')
+    counts = np.searchsorted(right_keys, left_keys, 'right') - start
+    total = int(counts.sum())
+    left_pos = np.repeat(left_order, counts)
+    # Position of every match inside the run of equal right keys.
+    run_offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_pos = right_order[np.repeat(start, counts) + run_offset]
+    return left_pos, right_pos
+
+def nestedLoopJoin(left_keys, right_keys, delim=None):
+    """
+    Join two key arrays by comparing every pair, a block of left rows against a block of right
+    rows at a time so no chunk holds more than NESTED_LOOP_PAIRS pairs. Without an operator this
+    is the cross product. Yields the matching (left positions, right positions) of every chunk,
+    left-major, so nothing is compared beyond what the consumer pulls.
+    """
+    right_step = max(1, min(len(right_keys), NESTED_LOOP_PAIRS))
+    left_step = max(1, NESTED_LOOP_PAIRS // right_step)
+    for left_start in range(0, len(left_keys), left_step):
+        left_chunk = np.arange(left_start, min(left_start+left_step, len(left_keys)))
+        for right_start in range(0, len(right_keys), right_step):
+            right_chunk = np.arange(right_start, min(right_start+right_step, len(right_keys)))
+            left_pos = np.repeat(left_chunk, len(right_chunk))
+            right_pos = np.tile(right_chunk, len(left_chunk))
+            if delim is not None:
+                mask = compareKeys(left_keys[left_pos], delim, right_keys[right_pos])
+                left_pos = left_pos[mask]
+                right_pos = right_pos[mask]
+            if len(left_pos):
+                yield left_pos, right_pos
+
+def compareKeys(left, delim, right):
+    """
+    Element-wise comparison of two aligned arrays.
+    """
+    if delim=='=':
+        return left == right
+    elif delim=='>':
+        return left > right
+    elif delim=='<':
+        return left < right
+    raise ValueError("Unsupported operator %s" % delim)
+
+def joinKeys(database, table, col, rows):
+    """
+    Gather the join key values of the given rows along with the positions of the non-NULL ones.
+    """
+    values, valid = database[table][col].take(rows)
+    keep = np.flatnonzero(valid)
+    return values[keep], keep
+
+def joinOrder(tables, views, predicates):
+    """
+    Order the tables are joined in, starting from the first one : a (table, predicate, filters)
+    step for every other table. predicates are (left table, left column, operator, right table,
+    right column) tuples. The predicate of a step is oriented as (joined side) op (new table), None
+    for a cross product, and filters are the predicates between tables joined by then.
+    """
+    joined = [tables[0]]
+    remaining = list(tables[1:])
+    pending = list(predicates)
+    steps = []
+    while remaining:
+        # Prefer a table connected by an equality predicate, smallest input first.
+        def connecting(table):
+            return [p for p in pending if (p[0] in joined and p[3]==table) or (p[3] in joined and p[0]==table)]
+        candidates = sorted(remaining, key=lambda t: (not any(p[2]=='=' for p in connecting(t)), len(views[t])))
+        table = candidates[0]
+        preds = connecting(table)
+        equi = [p for p in preds if p[2]=='=']
+        pred = equi[0] if equi else (preds[0] if preds else None)
+        if pred is not None:
+            pending.remove(pred)
+            if pred[0]==table:
+                flip = {'=':'=', '<':'>', '>':'<'}
+                pred = (pred[3], pred[4], flip[pred[2]], pred[0], pred[1])
+        joined.append(table)
+        remaining.remove(table)
+        # Predicates between tables that are now both joined become plain filters.
+        filters = [p for p in pending if p[0] in joined and p[3] in joined]
+        for p in filters:
+            pending.remove(p)
+        steps.append((table, pred, filters))
+    return steps
+
+def joinStep(database, batches, table, view, pred, filters, report):
+    """
+    Join relation batches with the rows of a table in view on a predicate (None for a cross
+    product) and keep the joined rows passing the filters. An equality join reads its whole
+    input and hash or merge joins it. The nested loop joins every batch as it arrives and
+    yields bounded chunks, so a consumer that stops pulling (LIMIT) stops the join.
+    report(method) is called with the algorithm once it is chosen.
+    """
+    if pred is not None and pred[2]=='=':
+        batches = list(batches)
+        if not batches:
+            return
+        relation = dict((t, np.concatenate([batch[t] for batch in batches])) for t in batches[0])
+        left_keys, left_keep = joinKeys(database, pred[0], pred[1], relation[pred[0]])
+        right_keys, right_keep = joinKeys(database, table, pred[4], view)
+        left_keys, right_keys = comparableValues(database[pred[0]][pred[1]], left_keys, database[table][pred[4]], right_keys)
+        left_sorted = isSorted(left_keys)
+        right_sorted = isSorted(right_keys)
+        method = chooseJoin(len(left_keys), len(right_keys), left_sorted, right_sorted)
+        report(method)
+        if method=='hash':
+            left_pos, right_pos = hashJoin(left_keys, right_keys)
+        else:
+            left_pos, right_pos = mergeJoin(left_keys, right_keys, left_sorted, right_sorted)
+        pieces = [(relation, left_keep[left_pos], right_keep[right_pos])]
+    else:
+        report('nested')
+        pieces = nestedPieces(database, batches, table, view, pred)
+    for relation, left_pos, right_pos in pieces:
+        joined = dict((t, rows[left_pos]) for t, rows in relation.items())
+        joined[table] = view[right_pos]
+        for p in filters:
+            left_vals, left_valid = database[p[0]][p[1]].take(joined[p[0]])
+            right_vals, right_valid = database[p[3]][p[4]].take(joined[p[3]])
+            left_vals, right_vals = comparableValues(database[p[0]][p[1]], left_vals, database[p[3]][p[4]], right_vals)
+            keep = np.flatnonzero(compareKeys(left_vals, p[2], right_vals) & left_valid & right_valid)
+            joined = dict((t, rows[keep]) for t, rows in joined.items())
+        for batch in scanRelation(joined):
+            yield batch
+
+def nestedPieces(database, batches, table, view, pred):
+    """
+    The (relation batch, left positions, right positions) chunks of a nested loop join.
+    """
+    if pred is None:
+        right_keys = right_keep = np.arange(len(view))
+    else:
+        right_keys, right_keep = joinKeys(database, table, pred[4], view)
+    for relation in batches:
+        if pred is None:
+            left_keys = left_keep = np.arange(batchLength(relation))
+            keys = right_keys
+        else:
+            left_keys, left_keep = joinKeys(database, pred[0], pred[1], relation[pred[0]])
+            left_keys, keys = comparableValues(database[pred[0]][pred[1]], left_keys, database[table][pred[4]], right_keys)
+        for left_pos, right_pos in nestedLoopJoin(left_keys, keys, pred[2] if pred else None):
+            yield relation, left_keep[left_pos], right_keep[right_pos]
@@ -0,0 +1,42 @@
+######################################
+# MiniSQL - Diagnostic messages      #
+######################################
+
+# Library imports
+import threading
+from termcolor import colored
+
+OFF, ERROR, INFO, DEBUG = 0, 1, 2, 3
+LEVELS = {'off': OFF, 'error': ERROR, 'info': INFO, 'debug': DEBUG}
+
+# Messages up to this level are printed. The interactive prompt shows everything,
+# scripts and programs embedding the engine stay silent unless asked otherwise.
+LEVEL = OFF
+_last = threading.local()
+
+def setLogLevel(level):
+    global LEVEL
+    LEVEL = LEVELS[level.lower()] if isinstance(level, basestring) else level
+
+def say(level, tag, color, *parts):
+    """
+    Print a diagnostic message : a colored tag followed by its parts, as print would.
+    Errors are remembered even when not printed, see lastError.
+    """
+    if level==ERROR:
+        _last.error = ' '.join(str(x) for x in parts) or tag
+    if level > LEVEL:
+        return
+    if parts:
+        print colored(tag, color), ' '.join(str(x) for x in parts)
+    else:
+        print colored(tag, color)
+
+def lastError():
+    """
+    The last error reported by the calling thread, None if there was none since clearError.
+    """
+    return getattr(_last, 'error', None)
+
+def clearError():
+    _last.error = None
@@ -6,30 +6,51 @@
 
 # Library imports
 import os
+import re
 import sys
+import time
+import itertools
 from termcolor import colored, cprint
+from log import say, setLogLevel, lastError, clearError, LEVELS, ERROR, INFO, DEBUG
+from results import Result, QueryError
+from profiler import QueryProfile, Counters, SlowQueryLog, recordQuery, profileRequest, SLOW_LOG_FILE, PROFILE_LABELS
 import json
 import csv
+import argparse
 import sqlparse
-import copy
 from terminaltables import AsciiTable
+import numpy as np
+from columnStore import Column, loadBinaryTable, convertTable, isBinaryTable, tableExists, BINARY_EXT
+from columnStore import appendRows, deleteRows, stageTable, csvBatches, newColumn, comparableValues, Text, COLUMN_KINDS, DEFAULT_KIND
+from wal import WriteAheadLog, finishCheckpoint
+from operators import scan, scanRanges, batchLength, filterBatches, project, limit, Aggregate, aggregateBatches, groupBatches, ResultStream, GROUP_BUDGET
+import parallel
+from parallel import useParallel, parallelFilter, parallelAggregate, parallelGroup
+from joins import joinOrder, joinStep, compareKeys
+from indexes import buildIndex, saveIndex, loadIndexes, invalidateIndexes, dropIndexes, readIndexDefinitions, writeIndexDefinitions
+from planCache import PlanCache, PreparedStatements, LITERAL, unquote
+from zoneMaps import loadZoneMaps, saveZoneMaps, invalidateZoneMaps, candidateBlocks, blockRanges, ZONE_ROWS
+from planner import Plan, tableRows, conditionFraction, columnStats, chooseAccess, joinEstimate
 
 # Global Variables
-database_path = ''
+# Rows per printed table when a result is streamed to the terminal.
+PAGE_ROWS = 1000
+# Outputs of computeQuery reporting a completed statement that has no result rows.
+STATUSES = ['table_created','data_inserted','data_deleted','data_truncated','table_dropped','table_converted','index_created','index_dropped','batch_started','committed','checkpointed','data_loaded','data_exported','statement_prepared','statement_deallocated','workers_set','slow_query_set']
 
 def fetchFiles(path):
     """
     Check if path provided exists. If so, load the data files.
     """
     if not os.path.isdir(path):
-        print colored("[ERROR]",'red'),"Invalid path, does not exist... ", path
+        say(ERROR, "[ERROR]", 'red', "Invalid path, does not exist... ", path)
         print "Try again?\n Path : ",
         new_path = raw_input()
         new_path, new_data = fetchFiles(new_path)
         return new_path, new_data
     else:
         data_files = os.listdir(path)
-        print colored("[INFO]",'green')+" Found %s files... Now populating database." % len(data_files)
+        say(INFO, "[INFO]", 'green', "Found %s files... Now populating database." % len(data_files))
         return path, data_files
 
 def groupGenerator(seq, delimitor):
@@ -44,55 +65,572 @@ def groupGenerator(seq, delimitor):
         group.append(ele)
     yield group
 
+def parseColumnDef(definition):
+    """
+    Split a column definition like "name TEXT" into its name and type, BIGINT when no type is given.
+    None if the type is not one of COLUMN_KINDS.
+    """
+    parts = definition.split()
+    kind = parts[1].upper() if len(parts) > 1 else DEFAULT_KIND
+    if len(parts) > 2 or kind not in COLUMN_KINDS:
+        return None
+    return parts[0], kind
+
+def readSchema(path):
+    """
+    Read the (table name, [(column, type)]) pairs of the metadata file, in file order.
+    """
+    with open(path+'/metadata.txt','r') as meta_file:
+        meta_content = meta_file.read().splitlines()
+    tables = filter(None, list(groupGenerator(meta_content, "<begin_table>")))
+    return [(table[1], [parseColumnDef(col) for col in table[2:-1]]) for table in tables]
+
+def readMetadata(path):
+    """
+    Read the (table name, columns) pairs of the metadata file, in file order.
+    """
+    return [(t_name, [col for col, kind in cols]) for t_name, cols in readSchema(path)]
+
+def writeSchema(path, schema):
+    """
+    Rewrite the metadata file from (table name, [(column, type)]) pairs.
+    """
+    with open(path+'/metadata.txt','w') as f:
+        for t_name, cols in schema:
+            f.write('<begin_table>\n%s\n' % t_name)
+            for col, kind in cols:
+                f.write('%s %s\n' % (col, kind))
+            f.write('<end_table>\n')
+
 def loadDatabases(path, data_files):
     """
-    Check if the metadata file exists and load the table contents accordingly.
+    Check if the metadata file exists and load the table contents accordingly. Returns the tables
+    and the write-ahead log they were replayed from.
     """
     if "metadata.txt" not in data_files:
-        print colored("[ERROR]",'red'),"Metadata file (metadata.txt) not found in provided database path!"
+        say(ERROR, "[ERROR]", 'red', "Metadata file (metadata.txt) not found in provided database path!")
         return "error"
     else:
         try:
-            with open(path+'/metadata.txt','r') as meta_file:
-                meta_content = meta_file.read().splitlines()
-                tables = filter(None, list(groupGenerator(meta_content, "<begin_table>")))
-                meta_tables = {}
-                for table in tables:
-                    t_name = table[1]
-                    meta_tables[t_name] = {}
-                    for col in table[2:-1]:
-                        meta_tables[t_name][col] = []
-            print 
-            print colored("> Database Schema : ","cyan")
-            print colored(json.dumps(meta_tables,sort_keys=True, indent=4),'cyan')
+            # A checkpoint interrupted by a crash is completed before reading any table.
+            if finishCheckpoint(path):
+                say(INFO, "[INFO]", 'green', "Completed an interrupted checkpoint.")
+            meta_tables = {}
+            kinds = {}
+            for t_name, cols in readSchema(path):
+                meta_tables[t_name] = {}
+                for col, kind in cols:
+                    meta_tables[t_name][col] = []
+                    kinds[t_name, col] = kind
+            say(DEBUG, "\n> Database Schema : \n"+json.dumps(meta_tables,sort_keys=True, indent=4), 'cyan')
 
             # Fill the data values
             for table_f in data_files:
-                if table_f=='metadata.txt':
+                # Binary tables are memory mapped, their pages load lazily.
+                if table_f.endswith(BINARY_EXT) and table_f[:-len(BINARY_EXT)] in meta_tables:
+                    t_name = table_f[:-len(BINARY_EXT)]
+                    cols, columns = loadBinaryTable(path+'/'+table_f)
+                    for col in meta_tables[t_name]:
+                        meta_tables[t_name][col] = columns[col]
+                        if kinds[t_name, col]!='TEXT':
+                            columns[col].kind = kinds[t_name, col]
+                    continue
+                if not table_f.endswith('.csv') or table_f[:-len('.csv')] not in meta_tables:
+                    continue
+                elif isBinaryTable(path, table_f[:-len('.csv')]):
+                    say(INFO, "[INFO]", 'green', table_f, "ignored, the binary table file takes precedence.")
                     continue
                 else:
-                    with open(path+'/'+table_f,'r') as tab_f:
-                        t_name = table_f.split('.')[0]
-                        table_content = [row for row in csv.reader(tab_f, delimiter=',',skipinitialspace=True)]
-                        try:
-                            header, contents = table_content[0], table_content[1:]
-                        except:
-                            print colored("[INFO]",'red'),table_f, "database is empty."
-                            header = []
-                            contents = []
-                        for row in contents:
-                            for col in meta_tables[t_name]:
-                                try:
-                                    meta_tables[t_name][col].append(int(row[header.index(col)]))
-                                except:
-                                    print colored("[ERROR]",'red'),"loading value %s failed, must be integer. Storing NULL instead" % str(row[header.index(col)])
-                                    meta_tables[t_name][col].append("NULL")
-
-            print colored("\n[INFO]",'green'),"Loading data values complete.\n"
-            return meta_tables
+                    # CSV tables are parsed in batches straight into their columns, like LOAD DATA.
+                    t_name = table_f.split('.')[0]
+                    cols = list(meta_tables[t_name])
+                    table = dict((col, newColumn(kinds[t_name, col])) for col in cols)
+                    for rows, bad in csvBatches(path+'/'+table_f, cols):
+                        if bad:
+                            say(ERROR, "[ERROR]", 'red', "%s rows of %s have the wrong number of values, skipped." % (bad, table_f))
+                        for i, col in enumerate(cols):
+                            for val in table[col].appendCells([row[i] for row in rows]):
+                                say(ERROR, "[ERROR]", 'red', "loading value %s failed, must be %s. Storing NULL instead" % (str(val), kinds[t_name, col]))
+                    if not len(table[cols[0]]):
+                        say(INFO, "[INFO]", 'red', table_f, "database is empty.")
+                    for col in cols:
+                        meta_tables[t_name][col] = table[col].compact()
+
+            # Tables without a data file are still typed columns.
+            for t_name in meta_tables:
+                for col in meta_tables[t_name]:
+                    if not isinstance(meta_tables[t_name][col], Column):
+                        meta_tables[t_name][col] = newColumn(kinds[t_name, col])
+            loadIndexes(path, meta_tables)
+            loadZoneMaps(path, meta_tables)
+
+            # Re-apply the writes committed since the last checkpoint.
+            wal = WriteAheadLog(path)
+            records = wal.records()
+            for record in records:
+                applyRecord(meta_tables, record)
+            if records:
+                say(INFO, "[INFO]", 'green', "Replayed %s write-ahead log records." % len(records))
+
+            say(INFO, "\n[INFO]", 'green', "Loading data values complete.\n")
+            return meta_tables, wal
         except:
-            print colored("[ERROR]",'red'),"Metadata file maybe corrupt! Format mismatch."
+            say(ERROR, "[ERROR]", 'red', "Metadata file maybe corrupt! Format mismatch.")
+            return "error"
+
+def parseCondition(cond):
+    """
+    Split a single condition like A>10 into its field, operator and value : an integer, a Text for
+    a quoted string, or the column name when comparing against another column (table1.B=table2.B).
+    """
+    match = re.match(r'^\s*([^=<>\s]+)\s*([=<>])\s*(.*?)\s*$', cond, re.S)
+    if not match:
+        say(ERROR, "[ERROR]", 'red', "Invalid operator! Only =,>,< are supported.")
+        return "error"
+    field, delim, value = match.groups()
+    try:
+        return field, delim, int(value)
+    except:
+        if re.match(r'^(\'[^\']*\'|"[^"]*")$', value):
+            return field, delim, Text(value[1:-1])
+        if re.match(r'^[A-Za-z_]\w*(\.[A-Za-z_]\w*)?$', value):
+            return field, delim, value
+        say(ERROR, "[ERROR]", 'red', 'Values can only be integers or quoted strings! Not %s.' % str(value))
+        return "error"
+
+def parseWhere(clause):
+    """
+    Split a where clause into conditions and the AND/OR connectors between them.
+    """
+    conditions = []
+    clause = re.sub(r'^where\s+', '', clause.split(';')[0].strip(), flags=re.I)
+    # Connectors are split on outside quoted strings only.
+    parts = []
+    start = 0
+    for match in re.finditer(r'\'[^\']*\'|"[^"]*"|\s+(and|or)\s+', clause, flags=re.I):
+        if match.group(1):
+            parts += [clause[start:match.start()], match.group(1)]
+            start = match.end()
+    parts.append(clause[start:])
+    for i, part in enumerate(parts):
+        if i % 2:
+            conditions.append(part.upper())
+            continue
+        if parseCondition(part)=="error":
+            return "error"
+        # Whitespace is dropped, except inside quoted strings.
+        conditions.append(re.sub(r'(\'[^\']*\'|"[^"]*")|\s+', lambda m: m.group(1) or '', part))
+    return conditions
+
+def conditionGroups(conditions):
+    """
+    Turn a list of conditions and connectors into OR-ed groups of AND-ed (field, operator, value) tuples.
+    """
+    groups = [[]]
+    for cond in conditions:
+        if isinstance(cond, tuple):
+            continue
+        if cond.upper()=='OR':
+            groups.append([])
+        elif cond.upper()!='AND':
+            parsed = parseCondition(cond)
+            if parsed=="error":
+                return "error"
+            groups[-1].append(parsed)
+    return [group for group in groups if group]
+
+def resolveColumn(table_name, table, field):
+    """
+    Map a (possibly table qualified) field onto a column of the table, None if it does not belong to it.
+    """
+    if '.' in field:
+        prefix, field = field.split('.', 1)
+        if prefix!=table_name:
+            return None
+    if field in table:
+        return field
+    return None
+
+def compareColumns(left, delim, right, rows=None):
+    """
+    Evaluate `left <delim> right` between two columns of one table over the given rows (all if None)
+    into a boolean mask. NULLs never match.
+    """
+    left_vals, left_valid = left.take(rows)
+    right_vals, right_valid = right.take(rows)
+    left_vals, right_vals = comparableValues(left, left_vals, right, right_vals)
+    return compareKeys(left_vals, delim, right_vals) & left_valid & right_valid
+
+def buildMask(table_name, table, groups):
+    """
+    Evaluate the conditions over whole columns of a table into a boolean selection mask.
+    Conditions involving columns the table does not have are skipped, None means every row survives.
+    Every condition only runs on the rows the previous ones (and earlier groups) left undecided,
+    starting from the blocks the zone maps could not rule out.
+    """
+    mask = None
+    ranges = zoneRanges(table_name, table, groups)
+    candidates = None if ranges is None else np.concatenate([np.arange(start, stop) for start, stop in ranges] or [np.arange(0)])
+    for group in groups:
+        if mask is None:
+            rows = candidates
+        else:
+            rows = np.flatnonzero(~mask) if candidates is None else candidates[~mask[candidates]]
+        applied = False
+        for field, delim, value in group:
+            col = resolveColumn(table_name, table, field)
+            if col is None:
+                continue
+            if isinstance(value, str):
+                other = resolveColumn(table_name, table, value)
+                if other is None:
+                    continue
+                hit = compareColumns(table[col], delim, table[other], rows)
+            else:
+                hit = table[col].compare(delim, value, rows)
+            rows = np.flatnonzero(hit) if rows is None else rows[hit]
+            applied = True
+        if not applied:
+            continue
+        if mask is None:
+            mask = np.zeros(tableRows(table), dtype=np.bool_)
+        mask[rows] = True
+    return mask
+
+def zoneRanges(table_name, table, groups):
+    """
+    Row ranges of the blocks of a table the zone maps can not rule out for the condition groups.
+    None if the zone maps rule nothing out.
+    """
+    resolved = []
+    for group in groups:
+        conds = [(resolveColumn(table_name, table, field), delim, value) for field, delim, value in group]
+        resolved.append([c for c in conds if c[0] is not None and not isinstance(c[2], str)])
+    blocks = candidateBlocks(table, resolved)
+    if blocks is None or blocks.all():
+        return None
+    return blockRanges(blocks, tableRows(table))
+
+def resolveField(database, tables, field):
+    """
+    Find the (table, column) a field of the query refers to, None if no queried table has it.
+    Unqualified fields present in several tables resolve to the first one.
+    """
+    if '.' in field:
+        table, col = field.split('.', 1)
+        if table in tables and col in database[table]:
+            return table, col
+        return None
+    for table in tables:
+        if field in database[table]:
+            return table, field
+    return None
+
+def relationMask(database, tables, relation, groups):
+    """
+    Evaluate the conditions over the aligned rows of a (joined) relation into a boolean mask.
+    Like buildMask, every condition only runs on the rows still undecided.
+    """
+    mask = None
+    for group in groups:
+        pos = None if mask is None else np.flatnonzero(~mask)
+        applied = False
+        for field, delim, value in group:
+            left = resolveField(database, tables, field)
+            if left is None:
+                continue
+            rows = relation[left[0]] if pos is None else relation[left[0]][pos]
+            left_col = database[left[0]][left[1]]
+            left_vals, left_valid = left_col.take(rows)
+            if isinstance(value, str):
+                right = resolveField(database, tables, value)
+                if right is None:
+                    continue
+                rows = relation[right[0]] if pos is None else relation[right[0]][pos]
+                right_col = database[right[0]][right[1]]
+                right_vals, right_valid = right_col.take(rows)
+                left_vals, right_vals = comparableValues(left_col, left_vals, right_col, right_vals)
+                hit = compareKeys(left_vals, delim, right_vals) & left_valid & right_valid
+            else:
+                hit = compareKeys(left_vals, delim, value) & left_valid
+            pos = np.flatnonzero(hit) if pos is None else pos[hit]
+            applied = True
+        if not applied:
+            continue
+        if mask is None:
+            mask = np.zeros(len(relation.values()[0]) if relation else 0, dtype=np.bool_)
+        mask[pos] = True
+    return mask
+
+def bindCondition(database, tables, cond):
+    """
+    Put the literal of a condition in the domain of its column : on TEXT columns it becomes the
+    dictionary code to compare the codes with, on integer columns a quoted literal must be an integer.
+    Comparisons between a TEXT and an integer column are refused, so are names (NULL included)
+    that are not columns of the queried tables.
+    """
+    field, delim, value = cond
+    target = resolveField(database, tables, field)
+    if target is None:
+        say(ERROR, "[ERROR]", 'red', "Unknown column %s in condition %s%s%s" % (field, field, delim, value))
+        return "error"
+    column = database[target[0]][target[1]]
+    if isinstance(value, str):
+        other = resolveField(database, tables, value)
+        if other is None:
+            if value.upper()=='NULL':
+                say(ERROR, "[ERROR]", 'red', "Comparisons with NULL are not supported, they never match!")
+            else:
+                say(ERROR, "[ERROR]", 'red', "Unknown column %s in condition %s%s%s" % (value, field, delim, value))
+            return "error"
+        if (database[other[0]][other[1]].kind=='TEXT')!=(column.kind=='TEXT'):
+            say(ERROR, "[ERROR]", 'red', "Can not compare %s with %s, TEXT only compares with TEXT!" % (field, value))
+            return "error"
+        return cond
+    if column.kind=='TEXT':
+        return field, delim, column.encodeLiteral(delim, value.value if isinstance(value, Text) else str(value))
+    if isinstance(value, Text):
+        try:
+            return field, delim, int(value.value)
+        except ValueError:
+            say(ERROR, "[ERROR]", 'red', "Column %s is %s, %s is not an integer!" % (field, column.kind, value))
             return "error"
+    return cond
+
+def planGroups(database, tables, groups):
+    """
+    Bind the literals of the conditions to their columns, order the conditions of every AND group
+    most selective first and drop the groups whose conditions min/max statistics rule out.
+    """
+    planned = []
+    for group in groups:
+        ranked = []
+        for cond in group:
+            cond = bindCondition(database, tables, cond)
+            if cond=="error":
+                return "error"
+            field, delim, value = cond
+            target = resolveField(database, tables, field)
+            if target is None:
+                ranked.append((1.0, cond))
+                continue
+            table = database[target[0]]
+            if not isinstance(value, str) and columnStats(table[target[1]]).excludes(delim, value):
+                break
+            ranked.append((conditionFraction(table, (target[1], delim, value)), cond))
+        else:
+            planned.append([cond for fraction, cond in sorted(ranked, key=lambda x: x[0])])
+    return planned
+
+def estimateFraction(database, tables, groups, only=None):
+    """
+    Estimated fraction of the rows of a relation over tables matching the condition groups,
+    assuming independent conditions. With only, just the constant conditions of that table count.
+    """
+    miss = 1.0
+    for group in groups:
+        fraction = 1.0
+        for field, delim, value in group:
+            target = resolveField(database, tables, field)
+            if target is None or (only is not None and (target[0]!=only or isinstance(value, str))):
+                continue
+            fraction *= conditionFraction(database[target[0]], (target[1], delim, value))
+        miss *= 1.0-fraction
+    return 1.0-miss if groups else 1.0
+
+def indexCandidates(table_name, table, group):
+    """
+    Row ids an index returns for the best indexed condition of an AND group, None if no index fits
+    or scanning is estimated to be cheaper. Returns the candidate rows, the condition they already
+    satisfy, the index and the estimated rows.
+    """
+    conds = [(resolveColumn(table_name, table, field), delim, value) for field, delim, value in group]
+    conds = [c for c in conds if c[0] is not None and not isinstance(c[2], str)]
+    chosen = chooseAccess(table, conds)
+    if chosen is None:
+        return None
+    cond, index, estimate = chosen
+    say(DEBUG, "Index", 'green', "%s.%s%s%s via %s index %s" % (table_name, cond[0], cond[1], cond[2], index.kind, index.name))
+    return index.lookup(cond[1], cond[2]), cond, index, estimate
+
+def selectRows(table_name, table, group, plan=None):
+    """
+    Row ids of a table satisfying an AND group of conditions, served by an index when one fits.
+    None means every row survives. The access path is recorded as a step of plan if given.
+    """
+    conds = [(resolveColumn(table_name, table, field), delim, value) for field, delim, value in group]
+    # Comparisons with another column are kept when that column is in this table too.
+    conds = [(col, delim, resolveColumn(table_name, table, value) if isinstance(value, str) else value)
+             for col, delim, value in conds if col is not None]
+    conds = [c for c in conds if c[2] is not None]
+    candidates = indexCandidates(table_name, table, group)
+    if candidates is None:
+        mask = buildMask(table_name, table, [group])
+        rows = None if mask is None else np.flatnonzero(mask)
+        detail = 'scan %s' % table_name
+    else:
+        rows, cond, index, estimate = candidates
+        for col, delim, value in conds:
+            if isinstance(value, str):
+                rows = rows[compareColumns(table[col], delim, table[value], rows)]
+            elif (col, delim, value)!=cond:
+                rows = rows[table[col].compare(delim, value, rows)]
+        detail = '%s index %s on %s.%s%s%s' % (index.kind, index.name, table_name, cond[0], cond[1], cond[2])
+    if plan is not None:
+        estimate = tableRows(table)
+        for col, delim, value in conds:
+            estimate *= conditionFraction(table, (col, delim, value))
+        plan.add('access', detail, estimate, tableRows(table) if rows is None else len(rows))
+    return rows
+
+def deleteMask(table_name, table, groups):
+    """
+    Boolean mask of the rows a DELETE with the given condition groups removes, None if no condition applies.
+    """
+    if len(groups)==1:
+        rows = selectRows(table_name, table, groups[0])
+        if rows is None:
+            return None
+        mask = np.zeros(len(table[table.keys()[0]]), dtype=np.bool_)
+        mask[rows] = True
+        return mask
+    return buildMask(table_name, table, groups)
+
+def joinGroup(database, plan, tables, group):
+    """
+    Join the tables for one AND group of conditions : its constant conditions (and comparisons
+    inside one table) are pushed down to every table, its comparisons between tables become join
+    predicates. Returns the joined batches and their estimated rows, or "error".
+    """
+    views = {}
+    estimates = {}
+    for table in tables:
+        views[table] = selectRows(table, database[table], group, plan)
+        if views[table] is None:
+            views[table] = np.arange(tableRows(database[table]))
+        estimates[table] = tableRows(database[table])*estimateFraction(database, tables, [group] if group else [], table)
+    join_preds = []
+    for field, delim, value in group:
+        if not isinstance(value, str):
+            continue
+        left = resolveField(database, tables, field)
+        right = resolveField(database, tables, value)
+        if left is None or right is None:
+            say(ERROR, "[ERROR]", 'red', "Unknown column in condition %s%s%s" % (field, delim, value))
+            return "error"
+        join_preds.append(left+(delim,)+right)
+    join_preds = [p for p in join_preds if p[0]!=p[3]]
+    # Joining starts from the smallest input.
+    order = sorted(tables, key=lambda t: len(views[t]))
+    batches = iter([{order[0]: views[order[0]]}])
+    joined = [order[0]]
+    estimate = estimates[order[0]]
+    for table, pred, filters in joinOrder(order, views, join_preds):
+        preds = [p for p in join_preds if (p[0] in joined and p[3]==table) or (p[3] in joined and p[0]==table)]
+        preds.sort(key=lambda p: p[2]!='=')
+        estimate = joinEstimate(database, estimate, estimates[table], preds[0] if preds else None)
+        step = plan.add('join', '%s via nested join' % table, estimate)
+        def report(method, step=step, table=table):
+            say(DEBUG, "Join", 'green', "%s via %s join" % (table, method))
+            step[1] = '%s via %s join' % (table, method)
+        batches = plan.count(joinStep(database, batches, table, views[table], pred, filters, report), step)
+        joined.append(table)
+    return batches, estimate
+
+def unionGroups(database, plan, tables, groups):
+    """
+    Rows of several tables matching any of the OR-ed groups : the union of the joins of every
+    group, each on its own predicates. Rows an earlier group produced are dropped from the later ones.
+    Returns the batches and their estimated rows, or "error".
+    """
+    parts = []
+    estimate = 0
+    for i, group in enumerate(groups):
+        joined = joinGroup(database, plan, tables, group)
+        if joined=="error":
+            return "error"
+        batches, group_estimate = joined
+        if i:
+            def unseen(batch, earlier=groups[:i]):
+                mask = relationMask(database, tables, batch, earlier)
+                return np.zeros(batchLength(batch), dtype=np.bool_) if mask is None else ~mask
+            batches = filterBatches(batches, unseen)
+        parts.append(batches)
+        estimate += group_estimate
+    step = plan.add('union', 'union of %s OR groups' % len(groups), estimate)
+    return plan.count(itertools.chain(*parts), step), estimate
+
+def applyRecord(database, record):
+    """
+    Re-apply a write-ahead log record to the in-memory tables.
+    """
+    table_name = record['table']
+    if table_name not in database:
+        return
+    table = database[table_name]
+    if record['op']=='insert':
+        appendRows(table, record['cols'], record['rows'])
+    elif record['op']=='delete':
+        groups = planGroups(database, [table_name], conditionGroups(record['conditions']))
+        mask = None if groups=="error" else deleteMask(table_name, table, groups)
+        if mask is not None:
+            deleteRows(table, ~mask)
+    elif record['op']=='truncate':
+        deleteRows(table, np.zeros(len(table[table.keys()[0]]), dtype=np.bool_))
+
+def commitStatement(db, session):
+    """
+    Make the log records of a statement durable, unless the session has a BEGIN batch open : the
+    batch holds them until its COMMIT. Checkpoints a large log.
+    """
+    if session.batch:
+        session.pending += db.wal.release()
+        return
+    db.wal.commit()
+    if db.wal.needsCheckpoint():
+        checkpoint(db)
+
+def endBatch(db, session):
+    """
+    Close the BEGIN batch of a session, committing the log records it held. Returns their number.
+    """
+    session.batch = False
+    db.batches.discard(session)
+    records, session.pending = session.pending, []
+    count = db.wal.commit(records)
+    if db.wal.needsCheckpoint():
+        checkpoint(db)
+    return count
+
+def holdsBatches(db):
+    """
+    True while a BEGIN batch holds writes that are in the in-memory tables but not yet committed.
+    """
+    return any(session.pending for session in db.batches)
+
+def checkpoint(db):
+    """
+    Fold the write-ahead log into the table files and re-save the indexes and zone maps of the changed tables.
+    Deferred (returns None) while open batches hold uncommitted writes, the table files would make them durable.
+    """
+    if holdsBatches(db):
+        say(DEBUG, "Checkpoint", 'green', "deferred, open batches hold uncommitted writes")
+        return None
+    database, database_path, wal = db.tables, db.path, db.wal
+    def stage(t_name):
+        invalidateIndexes(database_path, t_name)
+        invalidateZoneMaps(database_path, t_name)
+        return stageTable(database_path, t_name, database[t_name])
+    def install(t_name):
+        for col in database[t_name]:
+            for index in database[t_name][col].indexes.values():
+                saveIndex(database_path, index)
+        saveZoneMaps(database_path, t_name, database[t_name])
+    wal.dirty &= set(database.keys())
+    tables = wal.checkpoint(stage, install)
+    if tables:
+        say(INFO, "[INFO]", 'green', "Checkpointed tables : %s" % ', '.join(tables))
+    return tables
 
 def parseQuery(query):
     """
@@ -102,6 +640,99 @@ def parseQuery(query):
     tables = []
     conditions = []
     
+    index_def = re.match(r'^\s*create\s+index\s+(\w+)\s+on\s+(\w+)\s*\(\s*(\w+)\s*\)(?:\s+using\s+(hash|btree))?\s*;?\s*$', query, re.I)
+    if index_def:
+        name, table, col, kind = index_def.groups()
+        kind = (kind or 'btree').lower()
+        say(DEBUG, "Index", 'green', name)
+        say(DEBUG, "On", 'green', "%s(%s) using %s" % (table, col, kind))
+        return ['create_index'], [table], [name, col, kind]
+
+    convert = re.match(r'^\s*convert\s+(\w+)\s+to\s+(binary|csv)\s*;?\s*$', query, re.I)
+    if convert:
+        say(DEBUG, "Table", 'green', convert.group(1))
+        say(DEBUG, "To Do", 'green', 'Convert to %s' % convert.group(2).lower())
+        return ['convert'], [convert.group(1)], [convert.group(2).lower()]
+
+    load = re.match(r'^\s*load\s+data\s+from\s+[\'"](.+)[\'"]\s+into\s+(?:table\s+)?(\w+)\s*;?\s*$', query, re.I)
+    if load:
+        say(DEBUG, "Table", 'green', load.group(2))
+        say(DEBUG, "File", 'green', load.group(1))
+        return ['load'], [load.group(2)], [load.group(1)]
+
+    workers = re.match(r'^\s*set\s+workers\s+(\d+)\s*;?\s*$', query, re.I)
+    if workers:
+        say(DEBUG, "To Do", 'green', 'Use %s workers' % workers.group(1))
+        return ['set_workers'], [], [int(workers.group(1))]
+
+    slow = re.match(r'^\s*set\s+slow_query_ms\s+(\d+)\s*;?\s*$', query, re.I)
+    if slow:
+        say(DEBUG, "To Do", 'green', 'Log queries slower than %s ms' % slow.group(1))
+        return ['set_slow_query'], [], [int(slow.group(1))]
+
+    control = re.match(r'^\s*(begin|commit|checkpoint)\s*;?\s*$', query, re.I)
+    if control:
+        say(DEBUG, "To Do", 'green', control.group(1).lower())
+        return [control.group(1).lower()], [], []
+
+    explain = re.match(r'^\s*explain\s+(select\s.*)$', query, re.I|re.S)
+    if explain:
+        parsed = parseQuery(explain.group(1))
+        if parsed=="error":
+            return parsed
+        parsed[2].append(('explain', True))
+        return parsed
+
+    prepare = re.match(r'^\s*prepare\s+(\w+)\s+(?:as|from)\s+(.+?)\s*;?\s*$', query, re.I)
+    if prepare:
+        say(DEBUG, "Statement", 'green', prepare.group(1))
+        say(DEBUG, "To Do", 'green', 'Prepare')
+        return ['prepare'], [prepare.group(1)], [unquote(prepare.group(2))]
+
+    execute = re.match(r'^\s*execute\s+(\w+)(?:\s+using\s+(.+?))?\s*;?\s*$', query, re.I)
+    if execute:
+        params = LITERAL.findall(execute.group(2) or '')
+        say(DEBUG, "Statement", 'green', execute.group(1))
+        say(DEBUG, "Parameters", 'green', params)
+        return ['execute'], [execute.group(1)], params
+
+    deallocate = re.match(r'^\s*deallocate\s+(?:prepare\s+)?(\w+)\s*;?\s*$', query, re.I)
+    if deallocate:
+        say(DEBUG, "Statement", 'green', deallocate.group(1))
+        say(DEBUG, "To Do", 'green', 'Deallocate')
+        return ['deallocate'], [deallocate.group(1)], []
+
+    if re.match(r'^\s*show\s+plan\s+cache\s*;?\s*$', query, re.I):
+        say(DEBUG, "To Do", 'green', 'Show plan cache')
+        return ['show_cache'], [], []
+
+    if re.match(r'^\s*show\s+counters\s*;?\s*$', query, re.I):
+        say(DEBUG, "To Do", 'green', 'Show counters')
+        return ['show_counters'], [], []
+
+    index_drop = re.match(r'^\s*drop\s+index\s+(\w+)\s*;?\s*$', query, re.I)
+    if index_drop:
+        say(DEBUG, "Index", 'green', index_drop.group(1))
+        say(DEBUG, "To Do", 'green', 'Drop Index')
+        return ['drop_index'], [], [index_drop.group(1)]
+
+    # GROUP BY, LIMIT and INTO OUTFILE are taken off a SELECT before tokenizing
+    # and passed on as (name, value) modifiers after the conditions.
+    modifiers = []
+    if re.match(r'^\s*select\s', query, re.I):
+        outfile = re.search(r'\s+into\s+outfile\s+[\'"]([^\'"]+)[\'"]', query, re.I)
+        if outfile:
+            modifiers.append(('outfile', outfile.group(1)))
+            query = query[:outfile.start()]+query[outfile.end():]
+        limit_clause = re.search(r'\s+limit\s+(\d+)\s*;?\s*$', query, re.I)
+        if limit_clause:
+            modifiers.append(('limit', int(limit_clause.group(1))))
+            query = query[:limit_clause.start()]
+        group_clause = re.search(r'\s+group\s+by\s+(.+?)\s*;?\s*$', query, re.I)
+        if group_clause:
+            modifiers.append(('group', [x.strip() for x in group_clause.group(1).split(',')]))
+            query = query[:group_clause.start()]
+
     tokens = filter(None, [str(x).strip() for x in sqlparse.parse(query)[0].tokens])
     if ";" in tokens:
         tokens.remove(";")
@@ -110,398 +741,792 @@ def parseQuery(query):
         tokens = tokens[-1]
         tokens = tokens.split('(')
         table_name = tokens[0].strip()
-        table_cols = [x.strip() for x in tokens[1].split(')')[0].split(',')]
+        table_cols = [parseColumnDef(x) for x in tokens[1].split(')')[0].split(',')]
+        if None in table_cols:
+            say(ERROR, "[ERROR]", 'red', "Invalid column definition! Column types are %s." % ', '.join(COLUMN_KINDS))
+            return "error"
         select.append(table_name)
         tables+=table_cols
         conditions.append('create_table')
-        print colored("Table",'green'), select
-        print colored("Columns",'green'), tables
-        print colored("To Do",'green'), conditions
+        say(DEBUG, "Table", 'green', select)
+        say(DEBUG, "Columns", 'green', tables)
+        say(DEBUG, "To Do", 'green', conditions)
         return select, tables, conditions
 
     if ('insert' in tokens) or ('INSERT' in tokens):
         table = tokens[2]
-        values = [x.strip() for x in tokens[-1].split(',')]
-        print colored("Table",'green'), table
-        print colored("Values",'green'), values
+        values = re.sub(r'^values\s*', '', tokens[-1], flags=re.I).strip()
+        rows = re.findall(r'\(([^)]*)\)', values) or [values]
+        # Quoted strings may hold commas, they keep their quotes until stored.
+        values = [[x.strip() for x in re.findall(r'\'[^\']*\'|"[^"]*"|[^,\s][^,]*', row)] for row in rows]
+        say(DEBUG, "Table", 'green', table)
+        say(DEBUG, "Values", 'green', values)
         return ['insert'], table, values
 
     if ('delete' in tokens) or ('DELETE' in tokens):
         table = tokens[2]
-        condition = tokens[-1].split('where')[1].strip().split(';')[0].strip()
-        print colored("Table",'green'), table
-        print colored("Condition",'green'), condition
+        condition = parseWhere(tokens[-1])
+        if condition=="error":
+            return "error"
+        say(DEBUG, "Table", 'green', table)
+        say(DEBUG, "Condition", 'green', condition)
         return ['delete'], [table], condition
 
     if ('truncate' in tokens) or ('TRUNCATE' in tokens):
         table = tokens[2]
-        print colored("Table",'green'), table
-        print colored("To Do",'green'),'Delete records'
+        say(DEBUG, "Table", 'green', table)
+        say(DEBUG, "To Do", 'green', 'Delete records')
         return ['truncate'], [table], []
 
     if ('drop' in tokens) or ('DROP' in tokens):
         table = tokens[-1]
-        print colored("Table",'green'), table
-        print colored("To Do",'green'), 'Drop Table'
+        say(DEBUG, "Table", 'green', table)
+        say(DEBUG, "To Do", 'green', 'Drop Table')
         return ['drop'], [table], []
 
     if len(tokens) < 4:
-        print colored("[ERROR]",'red'),"Invalid query! FROM & SELECT parameters are mandatory"
+        say(ERROR, "[ERROR]", 'red', "Invalid query! FROM & SELECT parameters are mandatory")
         return "error"
     elif len(tokens) > 4:
-        if ('and' in tokens[-1]) or ('AND' in tokens[-1]):
-            try:
-                conds = tokens[-1].split('and')
-            except:
-                conds = tokens[-1].split('AND')
-        else:
-            conds = [tokens[-1]]
-        for cond in conds:
-            delim = ''
-            if '=' in cond:
-                delim = '='
-            elif '<' in cond:
-                delim = '<'
-            elif '>' in cond:
-                delim = '>'
-            else:
-                print colored("[ERROR]",'red'),"Invalid operator! Only =,>,< are supported."
-                return "error"
-            conditions+=[x.strip().split(';')[0] for x in [delim.join([x.strip() for x in cond.split(delim)]).split(' ')[-1]]]
-        
+        conditions = parseWhere(tokens[-1])
+        if conditions=="error":
+            return "error"
+
+    conditions += modifiers
     select = [x.strip() for x in tokens[1].split(',')]
     tables = [x.strip() for x in tokens[3].split(',')]
 
-    print colored("Select",'green'), select
-    print colored("Tables",'green'), tables
-    print colored("Conditions",'green'), conditions
+    say(DEBUG, "Select", 'green', select)
+    say(DEBUG, "Tables", 'green', tables)
+    say(DEBUG, "Conditions", 'green', conditions)
     
     return select, tables, conditions
 
-def computeQuery(select, tables, conditions, database):
+def computeQuery(select, tables, conditions, db, session):
     """
-    Calculate the query output.
+    Calculate the query output against an open Database, for one of its sessions.
     """
-    global database_path
-    output = copy.deepcopy(database)
+    database, database_path, wal, plans = db.tables, db.path, db.wal, db.plans
+    if 'prepare' in select:
+        count = session.prepared.prepare(tables[0], conditions[0])
+        say(INFO, "[DONE]", 'yellow', "Prepared %s with %s parameters" % (tables[0], count))
+        return "statement_prepared"
+
+    if 'execute' in select:
+        try:
+            parsed = plans.lookup(session.prepared.statement(tables[0], conditions))
+        except (KeyError, ValueError) as e:
+            say(ERROR, "[ERROR]", 'red', e.args[0])
+            return "error"
+        if parsed=="error":
+            return "error"
+        return computeQuery(parsed[0], parsed[1], parsed[2], db, session)
+
+    if 'deallocate' in select:
+        if not session.prepared.deallocate(tables[0]):
+            say(ERROR, "[ERROR]", 'red', "No prepared statement %s" % tables[0])
+            return "error"
+        say(INFO, "[DONE]", 'yellow', "Deallocated %s" % tables[0])
+        return "statement_deallocated"
+
+    if 'show_cache' in select:
+        stats = dict(plans.stats(), prepared=len(session.prepared))
+        labels = ['hits','misses','entries','capacity','prepared']
+        return ResultStream('plan cache', labels, iter([[tuple(stats[x] for x in labels)]]))
+
+    if 'set_workers' in select:
+        parallel.setWorkers(conditions[0])
+        say(INFO, "[DONE]", 'yellow', "Parallel operators use %s workers" % parallel.WORKERS)
+        return "workers_set"
+
+    if 'set_slow_query' in select:
+        db.slow_log.threshold_ms = conditions[0]
+        say(INFO, "[DONE]", 'yellow', "Logging queries slower than %s ms" % conditions[0])
+        return "slow_query_set"
+
+    if 'show_counters' in select:
+        counters = db.activity.export(plans.stats())
+        return ResultStream('counters', ['counter','value'], iter([sorted(counters.items())]))
+
+    if 'begin' in select:
+        wal.commit()
+        session.batch = True
+        db.batches.add(session)
+        say(INFO, "[DONE]", 'yellow', "Batching writes until COMMIT")
+        return "batch_started"
+
+    if 'commit' in select:
+        count = endBatch(db, session)
+        say(INFO, "[DONE]", 'yellow', "Committed %s log records" % count)
+        return "committed"
+
+    if 'checkpoint' in select:
+        if checkpoint(db) is None:
+            say(INFO, "[INFO]", 'green', "Checkpoint deferred until the open batches COMMIT")
+        return "checkpointed"
+
+    # Statements rewriting table or index files start from a clean log.
+    if [x for x in ['create_table','create_index','convert','drop'] if x in select or x in conditions]:
+        if checkpoint(db) is None:
+            say(ERROR, "[ERROR]", 'red', "Open batches hold uncommitted writes, COMMIT them first!")
+            return "error"
+
     if 'create_table' in conditions:
         table_name = select[0]
-        if table_name+'.csv' not in os.listdir(database_path):
+        if not tableExists(database_path, table_name):
             with open(database_path+'/metadata.txt','a') as f:
                 f.write('<begin_table>\n%s\n'%table_name)
-                for col in tables:
-                    f.write('%s\n'%col)
+                for col, kind in tables:
+                    f.write('%s %s\n' % (col, kind))
                 f.write('<end_table>\n')
             with open(database_path+'/'+table_name+'.csv','w') as f:
-                for col in tables[:-1]:
-                    f.write(col+',')
-                f.write(tables[-1]+'\n')
-            print colored("[DONE]",'yellow'),"New Table %s created with columns : %s" % (table_name,','.join(tables))
+                f.write(','.join(col for col, kind in tables)+'\n')
+            database[table_name] = dict((col, newColumn(kind)) for col, kind in tables)
+            say(INFO, "[DONE]", 'yellow', "New Table %s created with columns : %s" % (table_name, ','.join('%s %s' % x for x in tables)))
             return "table_created"
         else:
-            print colored("[ERROR]",'red'),"Table with name %s already exists!" % table_name
+            say(ERROR, "[ERROR]", 'red', "Table with name %s already exists!" % table_name)
+            return "error"
+
+    if 'create_index' in select:
+        table_name = tables[0]
+        name, col, kind = conditions
+        if table_name not in database or col not in database[table_name]:
+            say(ERROR, "[ERROR]", 'red', "No column %s in table %s!" % (col, table_name))
+            return "error"
+        definitions = readIndexDefinitions(database_path)
+        if name in [d[0] for d in definitions]:
+            say(ERROR, "[ERROR]", 'red', "Index with name %s already exists!" % name)
+            return "error"
+        index = buildIndex(name, table_name, col, kind, database[table_name][col])
+        saveIndex(database_path, index)
+        writeIndexDefinitions(database_path, definitions+[(name, table_name, col, kind)])
+        database[table_name][col].indexes[name] = index
+        say(INFO, "[DONE]", 'yellow', "New %s index %s created on %s(%s)" % (kind, name, table_name, col))
+        return "index_created"
+
+    if 'drop_index' in select:
+        name = conditions[0]
+        definitions = readIndexDefinitions(database_path)
+        matching = [d for d in definitions if d[0]==name]
+        if not matching:
+            say(ERROR, "[ERROR]", 'red', "No index with name %s!" % name)
             return "error"
+        name, table_name, col, kind = matching[0]
+        writeIndexDefinitions(database_path, [d for d in definitions if d[0]!=name])
+        if os.path.isfile(database_path+'/'+name+'.idx'):
+            os.remove(database_path+'/'+name+'.idx')
+        if table_name in database and col in database[table_name]:
+            database[table_name][col].indexes.pop(name, None)
+        say(INFO, "[DONE]", 'yellow', "Index %s dropped" % name)
+        return "index_dropped"
 
+    if 'convert' in select:
+        table_name = tables[0]
+        if table_name=='all':
+            names = sorted(database.keys())
+        elif table_name in database:
+            names = [table_name]
+        else:
+            say(ERROR, "[ERROR]", 'red', "No matching table found!")
+            return "error"
+        order = dict(readMetadata(database_path))
+        for name in names:
+            convertTable(database_path, name, order[name], database[name], conditions[0])
+            saveZoneMaps(database_path, name, database[name])
+            say(INFO, "[DONE]", 'yellow', "Table %s stored as %s" % (name, conditions[0]))
+        return "table_converted"
+
+    # DML is applied to the in-memory tables and made durable on disk right
+    # away, so nothing needs to be reloaded afterwards.
     if 'insert' in select:
         table_name = tables
         values = conditions
-        if len(conditions) != len(output[table_name].keys()):
-            print colored("ERROR",'red'), "Unequal number of values to insert! Expected %s"%(str(len(output[table_name].keys())))
-            return "error"
-        if table_name+'.csv' in os.listdir(database_path):
-            with open(database_path+'/'+table_name+'.csv','a') as f:
-                for val in values[:-1]:
-                    f.write(val+',')
-                f.write(values[-1]+'\n')
-            return "data_inserted"
-        else:
-            print colored("[ERROR]",'red'),"Unsupported value format!"
+        if table_name not in database:
+            say(ERROR, "[ERROR]", 'red', "No matching table found!")
             return "error"
+        for row in values:
+            if len(row) != len(database[table_name].keys()):
+                say(ERROR, "ERROR", 'red', "Unequal number of values to insert! Expected %s"%(str(len(database[table_name].keys()))))
+                return "error"
+        cols = dict(readMetadata(database_path))[table_name]
+        first = len(database[table_name][cols[0]])
+        failed = appendRows(database[table_name], cols, values)
+        for val in failed:
+            say(ERROR, "[ERROR]", 'red', "value %s is not a valid integer for its column. Storing NULL instead" % str(val))
+        # All tuples of the statement go into one log record and one commit.
+        new_rows = np.arange(first, first+len(values))
+        wal.append('insert', table_name, cols=cols, rows=zip(*[database[table_name][col].cells(new_rows) for col in cols]))
+        commitStatement(db, session)
+        say(INFO, "[DONE]", 'yellow', "Inserted %s rows into %s" % (len(values), table_name))
+        return "data_inserted"
+
+    if 'load' in select:
+        table_name = tables[0]
+        filename = conditions[0]
+        if table_name not in database:
+            say(ERROR, "[ERROR]", 'red', "No matching table found!")
+            return "error"
+        if not os.path.isfile(filename):
+            say(ERROR, "[ERROR]", 'red', "File %s does not exist!" % filename)
+            return "error"
+        # The loaded rows become durable through a checkpoint, which open batches would defer.
+        if holdsBatches(db):
+            say(ERROR, "[ERROR]", 'red', "Open batches hold uncommitted writes, COMMIT them first!")
+            return "error"
+        cols = dict(readMetadata(database_path))[table_name]
+        table = database[table_name]
+        first = len(table[cols[0]])
+        loaded = rejected = nulls = 0
+        start = time.time()
+        # Indexes are detached while loading and rebuilt once at the end.
+        detached = dict((col, table[col].indexes) for col in table)
+        for col in table:
+            table[col].indexes = {}
+        try:
+            for rows, bad in csvBatches(filename, cols):
+                nulls += len(appendRows(table, cols, rows))
+                loaded += len(rows)
+                rejected += bad
+        except:
+            keep = np.arange(len(table[cols[0]])) < first
+            deleteRows(table, keep)
+            say(ERROR, "[ERROR]", 'red', "Loading %s failed, no rows were added!" % filename)
+            loaded = None
+        for col in table:
+            table[col].indexes = dict((name, buildIndex(name, table_name, col, index.kind, table[col])) for name, index in detached[col].items())
+        if loaded is None:
+            return "error"
+        # The loaded rows are made durable by writing the table file, not through the log.
+        wal.dirty.add(table_name)
+        checkpoint(db)
+        elapsed = time.time()-start
+        say(INFO, "[DONE]", 'yellow', "Loaded %s rows into %s in %.2fs (%d rows/sec), %s rows rejected, %s values stored as NULL" % (loaded, table_name, elapsed, loaded/max(elapsed, 1e-6), rejected, nulls))
+        return "data_loaded"
 
     if 'drop' in select:
         table = tables[0]
-        if not output[table][output[table].keys()[0]]:
+        if table not in database:
+            say(ERROR, "[ERROR]", 'red', "No matching table found!")
+            return "error"
+        if not database[table][database[table].keys()[0]]:
             try:
-                os.remove(database_path+'/'+table+'.csv')
-                with open(database_path+'/metadata.txt','w') as f:
-                    for tab in output:
-                        if not tab==table:
-                            f.write('<begin_table>\n')
-                            f.write(tab+'\n')
-                            for col in sorted(output[tab].keys()):
-                                f.write(col+'\n')
-                            f.write('<end_table>\n')
+                if isBinaryTable(database_path, table):
+                    os.remove(database_path+'/'+table+BINARY_EXT)
+                else:
+                    os.remove(database_path+'/'+table+'.csv')
+                dropIndexes(database_path, table)
+                invalidateZoneMaps(database_path, table)
+                writeSchema(database_path, [(tab, cols) for tab, cols in readSchema(database_path) if tab!=table])
+                database.pop(table)
+                say(INFO, "[DONE]", 'yellow', "Table %s dropped" % table)
                 return "table_dropped"
             except:
-                print colored("[ERROR]",'red'),"Failed to remove table!"
+                say(ERROR, "[ERROR]", 'red', "Failed to remove table!")
                 return "error"
         else:
-            print colored("[ERROR]",'red'),'Table not empty! Try truncating first...'
-            print "Contents :", output[table][output[table].keys()[0]] 
+            say(ERROR, "[ERROR]", 'red', 'Table not empty! Try truncating first...')
+            say(INFO, "Contents :", 'yellow', nullCells(database[table][database[table].keys()[0]].toList()))
             return "error"
 
-    out_tables = output.keys()
-    for table in out_tables:
-        if table not in tables:
-            output.pop(table, None)
-    
     if 'delete' in select:
         table_name = tables[0]
-        delim = ''
-        if '=' in conditions:
-            delim = '='
-        elif '>' in conditions:
-            delim = '>'
-        elif '<' in conditions:
-            delim = '<'
-        else:
-            print colored("[ERROR]",'red'),"Invalid operator! Only =,>,< are supported."
+        groups = conditionGroups(conditions)
+        if groups=="error":
             return "error"
-        col, val = [x.strip() for x in conditions.split(delim)]
-        print col, val
-        try:
-            del_idx = output[table_name][col].index(int(val))
-            for col in output[table_name]:
-                del_ele = output[table_name][col].pop(del_idx)
-            with open(database_path+'/'+table_name+'.csv','w') as f:
-                cols = sorted(output[table_name].keys())
-                for col in cols[:-1]:
-                    f.write(col+',')
-                f.write(cols[-1]+'\n')
-                for i in range(len(output[table_name][cols[0]])):
-                    for col in cols[:-1]:
-                        f.write(str(output[table_name][col][i])+',')
-                    f.write(str(output[table_name][cols[-1]][i])+'\n')
-            return "data_deleted"
-        except:
-            print colored("[ERROR]",'red'),"No matching data-entry found!"
+        groups = planGroups(database, [table_name], groups)
+        if groups=="error":
             return "error"
+        mask = deleteMask(table_name, database[table_name], groups)
+        if mask is None or not mask.any():
+            say(ERROR, "[ERROR]", 'red', "No matching data-entry found!")
+            return "error"
+        deleteRows(database[table_name], ~mask)
+        wal.append('delete', table_name, conditions=conditions)
+        commitStatement(db, session)
+        say(INFO, "[DONE]", 'yellow', "Deleted %s rows from %s" % (int(mask.sum()), table_name))
+        return "data_deleted"
 
     if 'truncate' in select:
         table = tables[0]
         try:
-            with open(database_path+'/'+table+'.csv','w') as f:
-                cols = sorted(output[table].keys())
-                for col in cols[:-1]:
-                    f.write(col+',')
-                f.write(cols[-1]+'\n')
+            deleteRows(database[table], np.zeros(len(database[table][database[table].keys()[0]]), dtype=np.bool_))
+            wal.append('truncate', table)
+            commitStatement(db, session)
+            say(INFO, "[DONE]", 'yellow', "Table %s truncated" % table)
             return "data_truncated"
         except:
-            print colored("[ERROR]",'red'), "No matching table found!"
+            say(ERROR, "[ERROR]", 'red', "No matching table found!")
             return "error"
 
+    # Queries run as a pipeline of generators : scan -> filter -> project ->
+    # limit. Batches of row ids flow through it and columns are only copied
+    # when projecting, so nothing is computed beyond what the consumer pulls.
+    for table in tables:
+        if table not in database:
+            say(ERROR, "[ERROR]", 'red', "Table %s does not exist!" % table)
+            return "error"
+    groups = conditionGroups(conditions)
+    if groups=="error":
+        return "error"
+    modifiers = dict(c for c in conditions if isinstance(c, tuple))
 
-    if ('or' not in conditions) and ('OR' not in conditions):
-        for cond in conditions:
-            if cond=='AND' or cond=='and':
-                continue
-            delim = ''
-            if '=' in cond:
-                field, value = cond.split('=')
-                delim = '='
-            elif '>' in cond:
-                field, value = cond.split('>')
-                delim = '>'
-            elif '<' in cond:
-                field, value = cond.split('<')
-                delim = '<'
-            else:
-                print colored("[ERROR]",'red'),"Invalid operator! Only =,>,< are supported."
-                return "error"
+    # The planner orders every AND group most selective first and drops the groups
+    # min/max statistics rule out. If none is left no table needs to be read.
+    plan = Plan()
+    # Row ranges of a large single table scan, handed to the worker processes when set.
+    parallel_ranges = None
+    # Steps whose rows are read by the workers instead of the batch pipeline, they count them.
+    worker_steps = []
+    excluded = bool(groups)
+    groups = planGroups(database, tables, groups)
+    if groups=="error":
+        return "error"
+    excluded = excluded and not groups
+    if excluded:
+        plan.add('skip', 'min/max rule out every condition', 0, 0)
+        estimate = 0
+        batches = iter([])
+    elif len(tables)==1:
+        table = tables[0]
+        rows = tableRows(database[table])
+        step = plan.add('access', 'scan %s' % table, rows)
+        # An index narrows the scan to candidate rows, the conditions are still checked on them.
+        candidates = indexCandidates(table, database[table], groups[0]) if len(groups)==1 else None
+        ranges = zoneRanges(table, database[table], groups) if candidates is None else None
+        if candidates is not None:
+            rows, cond, index, estimate = candidates
+            step[1:3] = ['%s index %s on %s.%s%s%s' % (index.kind, index.name, table, cond[0], cond[1], cond[2]), int(round(estimate))]
+            batches = scan(table, rows)
+        elif ranges is not None:
+            # Zone maps : only the blocks that may hold matching rows are read.
+            scanned = sum(stop-start for start, stop in ranges)
+            step[1:3] = ['scan %s, %s of %s blocks' % (table, -(-scanned // ZONE_ROWS), -(-rows // ZONE_ROWS)), scanned]
+            batches = scanRanges(table, ranges)
+        else:
+            batches = scan(table, rows)
+        if candidates is None and useParallel(rows):
+            parallel_ranges = ranges if ranges is not None else [(0, rows)]
+            worker_steps = [step]
+        estimate = step[2]
+        batches = plan.count(batches, step)
+    else:
+        joined = joinGroup(database, plan, tables, groups[0] if groups else []) if len(groups) <= 1 else unionGroups(database, plan, tables, groups)
+        if joined=="error":
+            return "error"
+        batches, estimate = joined
+    predicate = lambda batch: relationMask(database, tables, batch, groups)
+    if groups:
+        estimate = 1
+        for t in tables:
+            estimate *= tableRows(database[t])
+        estimate *= estimateFraction(database, tables, groups)
+        detail = ' OR '.join(' AND '.join('%s%s%s' % cond for cond in group) for group in groups)
+        step = plan.add('filter', detail, estimate)
+        if parallel_ranges is not None:
+            step[1] += ' (%s workers)' % parallel.WORKERS
+            batches = plan.count(parallelFilter(tables[0], parallel_ranges, predicate, plan.tally(*worker_steps)), step)
+            worker_steps.append(step)
+        else:
+            batches = plan.count(filterBatches(batches, predicate), step)
 
-            try:
-                value = int(value)
-            except:
-                print colored("[ERROR]",'red'),'Values can only be integers! Not %s.' % str(value) 
+    # Projection : only the selected columns are materialized.
+    labels = []
+    columns = []
+    aggregates = []
+    keys = []
+    output = []
+    for field in modifiers.get('group', []):
+        resolved = resolveField(database, tables, field)
+        if resolved is None:
+            say(ERROR, "[ERROR]", 'red', "Unknown GROUP BY column %s" % field)
+            return "error"
+        keys.append(resolved)
+    aggregated = [('(' in ele) for ele in select]
+    if any(aggregated) and not all(aggregated) and not keys:
+        say(ERROR, "[ERROR]", 'red', "Aggregates can not be mixed with plain columns!")
+        return "error"
+    for ele in select:
+        if ele.replace(' ','').lower()=='count(*)':
+            labels.append('count(*)')
+            output.append(('agg', len(aggregates)))
+            aggregates.append((Aggregate('count'), tables[0], None))
+            continue
+        if ele=='*':
+            if keys:
+                say(ERROR, "[ERROR]", 'red', "* can not be selected with GROUP BY!")
                 return "error"
             for table in tables:
-                if field in output[table]:
-                    del_field = []
-                    for i in range(len(output[table][field])):
-                        if delim=='=':
-                            if output[table][field][i] != value:
-                                del_field.append(i)
-                        elif delim=='>':
-                            if output[table][field][i] <= value:
-                                del_field.append(i)
-                        elif delim=='<':
-                            if output[table][field][i] >= value:
-                                del_field.append(i)
-                    for i in sorted(del_field, reverse=True):
-                        for field_del in output[table]:
-                            output[table][field_del].remove(output[table][field_del][i])
-    # OR type of queries                        
-    else:
-        delim1 = ''
-        delim2 = ''
-        cond1 = conditions[0]
-        cond2 = conditions[-1]
-        if '=' in cond1:
-            field1, value1 = cond1.split('=')
-            delim1 = '='
-        elif '>' in cond1:
-            field1, value1 = cond1.split('>')
-            delim1 = '>'
-        elif '<' in cond1:
-            field1, value1 = cond1.split('<')
-            delim1 = '<'
+                for col in sorted(database[table].keys()):
+                    labels.append(table+'.'+col)
+                    columns.append((table, database[table][col]))
+            continue
+        field = ele.split('(')[-1].split(')')[0].strip()
+        resolved = resolveField(database, tables, field)
+        if resolved is None:
+            continue
+        table, col = resolved
+        if '(' in ele:
+            func = ele.split('(')[0].strip().lower()
+            if func not in Aggregate.FUNCS:
+                return []
+            if func in ['sum','avg'] and database[table][col].kind=='TEXT':
+                say(ERROR, "[ERROR]", 'red', "%s can not be computed over TEXT column %s.%s!" % (func, table, col))
+                return "error"
+            labels.append('%s(%s.%s)' % (func, table, col))
+            output.append(('agg', len(aggregates)))
+            aggregates.append((Aggregate(func), table, database[table][col]))
+        elif keys:
+            if (table, col) not in keys:
+                say(ERROR, "[ERROR]", 'red', "Column %s.%s must appear in GROUP BY or an aggregate!" % (table, col))
+                return "error"
+            labels.append(table+'.'+col)
+            output.append(('key', keys.index((table, col))))
         else:
-            print colored("[ERROR]",'red'),"Invalid operator! Only =,>,< are supported."
-            return "error"
-
-        if '=' in cond2:
-            field2, value2 = cond2.split('=')
-            delim2 = '='
-        elif '>' in cond2:
-            field2, value2 = cond2.split('>')
-            delim2 = '>'
-        elif '<' in cond2:
-            field2, value2 = cond2.split('<')
-            delim2 = '<'
+            labels.append(table+'.'+col)
+            columns.append((table, database[table][col]))
+    if not labels:
+        return {}
+    if keys:
+        groups_estimate = 1
+        for table, col in keys:
+            groups_estimate *= columnStats(database[table][col]).distinct()+1
+        estimate = min(estimate, groups_estimate)
+        step = plan.add('group', 'hash group by %s' % ', '.join('%s.%s' % key for key in keys), estimate)
+        keys = [(table, database[table][col]) for table, col in keys]
+        funcs = [(state.func, table, column) for state, table, column in aggregates]
+        # Workers keep every group of their rows in memory, so only small group counts go parallel.
+        if parallel_ranges is not None and groups_estimate <= GROUP_BUDGET:
+            step[1] += ' (%s workers)' % parallel.WORKERS
+            batches = parallelGroup(tables[0], parallel_ranges, predicate if groups else lambda batch: None, keys, funcs, output, plan.tally(*worker_steps))
         else:
-            print colored("[ERROR]",'red'),"Invalid operator! Only =,>,< are supported."
-            return "error"
-        try:
-            value1 = int(value1)
-            value2 = int(value2)
-        except:
-            print colored("[ERROR]",'red'),'Values can only be integers! Not %s or %s.' % (str(value1), str(value2)) 
-           
-        for table in tables:
-            if (field1 in output[table]) or (field2 in output[table]): 
-                if (field1 in output[table]) and (field2 not in output[table]):
-                    field = field1
-                    value = value1
-                    delim = delim1
-                else:
-                    field = field2
-                    value = value2
-                    delim = delim2
-                del_field = []
-                for i in range(len(output[table][field])):
-                    if delim=='=':
-                        if output[table][field][i] != value:
-                            del_field.append(i)
-                    elif delim=='>':
-                        if output[table][field][i] <= value:
-                            del_field.append(i)
-                    elif delim=='<':
-                        if output[table][field][i] >= value:
-                            del_field.append(i)
-                for i in sorted(del_field, reverse=True):
-                    for field_del in output[table]:
-                        output[table][field_del].remove(output[table][field_del][i])
-            
-    if len(select)==1:
-        ele = select[0]
-        if not ele=='*':            
-            field = ele.split('(')[-1].split(')')[0]
-            for table in tables:
-                if field in output[table]:
-                    if 'max' in ele:
-                        output[table][field] = [max(output[table][field])]
-                    elif 'min' in ele:
-                        output[table][field] = [min(output[table][field])]
-                    elif 'avg' in ele:
-                        output[table][field] = [float(sum(output[table][field]))/len(output[table][field])]
-                    elif 'sum' in ele:
-                        output[table][field] = [sum(output[table][field])]
-                    elif 'count' in ele:
-                        output[table][field] = [len(output[table][field])]
-                    elif 'distinct' in ele:
-                        output[table][field] = [list(set(output[table][field]))]
-                    elif ('(' in ele):
-                        output = []
-                        return output
-                    del_fields = output[table].keys()
-                    for del_f in del_fields:
-                        if del_f != field:
-                            output[table].pop(del_f, None)
-                else:
-                    output.pop(table, None)
+            batches = groupBatches(batches, keys, funcs, output)
+    elif aggregates:
+        estimate = 1
+        step = plan.add('aggregate', ', '.join(labels), estimate)
+        if parallel_ranges is not None:
+            step[1] += ' (%s workers)' % parallel.WORKERS
+            funcs = [(state.func, table, column) for state, table, column in aggregates]
+            batches = parallelAggregate(tables[0], parallel_ranges, predicate if groups else lambda batch: None, funcs, [state for state, table, column in aggregates], plan.tally(*worker_steps))
+        else:
+            batches = aggregateBatches(batches, aggregates)
     else:
-        for table in tables:
-            del_fields = output[table].keys()
-            for del_f in del_fields:
-                if del_f not in select:
-                    output[table].pop(del_f, None)
-            
-    return output
+        step = plan.add('project', ', '.join(labels), estimate)
+        batches = project(batches, columns)
+    batches = plan.count(batches, step, relation=False)
+    if 'limit' in modifiers:
+        estimate = min(estimate, modifiers['limit'])
+        step = plan.add('limit', str(modifiers['limit']), estimate)
+        batches = plan.count(limit(batches, modifiers['limit']), step, relation=False)
+    result = ResultStream(','.join(tables), labels, batches, plan)
+
+    # EXPLAIN runs the query to report the actual rows of every step next to the estimates.
+    if 'explain' in modifiers:
+        for batch in result.batches:
+            pass
+        return ResultStream('plan', ['step','detail','estimated rows','actual rows'], iter([plan.rows()]))
+
+    if 'outfile' in modifiers:
+        count = 0
+        with open(modifiers['outfile'],'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(labels)
+            for batch in result.batches:
+                writer.writerows(nullCells(row) for row in batch)
+                count += len(batch)
+        say(INFO, "[DONE]", 'yellow', "Wrote %s rows to %s" % (count, modifiers['outfile']))
+        return "data_exported"
+    return result
+
+class Session(object):
+    """
+    One client of a Database : its BEGIN batch with the log records held until COMMIT, and its
+    prepared statements.
+    """
+    def __init__(self):
+        self.batch = False
+        self.pending = []
+        self.prepared = PreparedStatements()
 
-def startEngine(database):
+class Database(object):
+    """
+    A database directory opened for programs embedding the engine. execute runs one statement
+    and returns a Result, rejected statements raise QueryError. Every Database keeps its own
+    write-ahead log, plan cache, slow query log and counters. Statements run in the default
+    session unless given one.
+    """
+    def __init__(self, path):
+        if not os.path.isdir(path):
+            raise IOError("Invalid path, does not exist... %s" % path)
+        self.path = path
+        self.session = Session()
+        # Sessions with an open BEGIN batch.
+        self.batches = set()
+        self.slow_log = SlowQueryLog(os.path.join(path, SLOW_LOG_FILE))
+        # Statement counters since the database was opened.
+        self.activity = Counters()
+        self.load()
+
+    def load(self):
+        """
+        (Re)read every table from the database files and replay the write-ahead log.
+        """
+        clearError()
+        start = time.time()
+        path, data_files = fetchFiles(self.path)
+        loaded = loadDatabases(path, data_files)
+        if loaded=="error":
+            raise IOError(lastError() or "Could not load the database at %s" % self.path)
+        self.tables, self.wal = loaded
+        self.plans = PlanCache(parseQuery)
+        self.activity.loaded(time.time()-start, sum(tableRows(table) for table in self.tables.values()))
+
+    def run(self, query, profile=False, session=None):
+        """
+        Run one statement into a reply : its status and result rows, or the error. A profiled
+        statement (profile set, or PROFILE <statement>) also gets its QueryProfile as a dict,
+        PROFILE <statement> answers with the profile rows instead of the result.
+        """
+        query, requested = profileRequest(query)
+        timings = QueryProfile(query)
+        reply, plan = self.runProfiled(query, timings, session or self.session)
+        recordQuery(timings.finish(reply['status'], plan), self.activity, self.slow_log)
+        if requested:
+            return {'status': 'rows', 'labels': PROFILE_LABELS, 'rows': timings.rows(), 'profile': timings.asDict()}
+        if profile:
+            reply['profile'] = timings.asDict()
+        return reply
+
+    def runProfiled(self, query, timings, session):
+        clearError()
+        if query.split(';')[0].strip().lower()=='rebase data':
+            with timings.stage('rebase'):
+                endBatch(self, session)
+                if holdsBatches(self):
+                    return {'status': 'error', 'error': 'Open batches hold uncommitted writes, COMMIT them first!'}, None
+                self.wal.commit()
+                self.load()
+            return {'status': 'rebased'}, None
+        try:
+            with timings.stage('parse'):
+                parsed = self.plans.lookup(query)
+        except ValueError as e:
+            return {'status': 'error', 'error': e.args[0]}, None
+        if parsed=="error":
+            return {'status': 'error', 'error': lastError() or 'Could not parse the query'}, None
+        with timings.stage('plan'):
+            output = computeQuery(parsed[0], parsed[1], parsed[2], self, session)
+        if output=="error":
+            return {'status': 'error', 'error': lastError() or 'Query failed'}, None
+        if output in STATUSES:
+            return {'status': output}, None
+        if not output:
+            return {'status': 'error', 'error': 'Incorrect operations asked for! No output plausible.'}, None
+        with timings.stage('fetch', consumer=True):
+            rows = list(output)
+        return {'status': 'rows', 'labels': output.labels, 'rows': rows}, output.plan
+
+    def execute(self, query, profile=False, session=None):
+        """
+        Run one statement. With profile the Result carries the statement's profile as a dict.
+        """
+        reply = self.run(query, profile, session)
+        if reply['status']=='error':
+            raise QueryError(reply['error'])
+        return Result(reply)
+
+    def counters(self):
+        return self.activity.export(self.plans.stats())
+
+    def executeScript(self, script):
+        """
+        Run every statement of a script, statements end with ';'. Stops at the first error.
+        """
+        return [self.execute(query) for query in splitStatements(script)]
+
+    def endSession(self, session):
+        """
+        A session going away commits the batch it left open.
+        """
+        if session.batch or session.pending:
+            endBatch(self, session)
+
+    def close(self):
+        self.endSession(self.session)
+        checkpoint(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.close()
+
+def splitStatements(script):
+    """
+    The statements of a script, comments and blank statements dropped.
+    """
+    statements = [sqlparse.format(x, strip_comments=True).strip() for x in sqlparse.split(script)]
+    return [x for x in statements if x.strip(';').strip()]
+
+def runScript(database, script, output_format):
+    """
+    Batch mode : run every statement of a script, writing result rows to stdout as CSV or tables.
+    Returns False once a statement fails, the rest of the script is skipped.
+    """
+    writer = csv.writer(sys.stdout)
+    for query in splitStatements(script):
+        try:
+            result = database.execute(query)
+        except QueryError as e:
+            sys.stderr.write("[ERROR] %s\n  in : %s\n" % (e.args[0], query))
+            return False
+        if result.status!='rows':
+            continue
+        if output_format=='csv':
+            writer.writerow(result.labels)
+            writer.writerows(nullCells(row) for row in result.rows)
+        else:
+            printResult(ResultStream(','.join(result.labels), result.labels, iter([result.rows])))
+    return True
+
+def nullCells(row):
+    """
+    A result row as printed or written to CSV : NULLs (None) spelled NULL.
+    """
+    return ["NULL" if x is None else x for x in row]
+
+def printResult(result):
+    """
+    Print a result in pretty table format. Results of up to PAGE_ROWS rows print as one table,
+    larger ones are streamed a page at a time so memory stays bounded.
+    """
+    page = []
+    printed = 0
+    for batch in result.batches:
+        for row in batch:
+            page.append([str(x) for x in nullCells(row)])
+            if len(page)==PAGE_ROWS:
+                printed += printPage(result, page, printed)
+                page = []
+    if page or not printed:
+        printed += printPage(result, page, printed)
+    if printed > PAGE_ROWS:
+        print colored("[INFO]",'green'),"%s rows" % printed
+
+def printPage(result, rows, offset):
+    title = result.name if not offset else '%s (from row %s)' % (result.name, offset+1)
+    table = AsciiTable([result.labels]+rows+[[]], title)
+    print ""
+    print table.table
+    return len(rows)
+
+def startEngine(db):
     """
     Main controller function for taking query inputs and displaying respective outputs.
     """
+    timing = False
     print colored("MiniSQL>",'cyan'),
     query = raw_input()
     while query!='q':
         try:
             if query.split(';')[0].lower()=='rebase data':
-                global database_path
-                path, data_files = fetchFiles(database_path)
-                database = loadDatabases(path, data_files)
-                if database=="error":
+                endBatch(db, db.session)
+                try:
+                    db.load()
+                except IOError:
                     print colored("[ERROR]",'red'), "Database corrupted! Manually edit data to verify."
-                    query='q'
-                    continue
+                    return
                 print colored("MiniSQL>",'cyan'),
                 query = raw_input()
                 continue
 
-            select, tables, conditions = parseQuery(query)
-            output = computeQuery(select, tables, conditions, database) 
+            if query.strip()=='\\timing':
+                timing = not timing
+                print colored("[INFO]",'green'), "Timing is %s." % ('on' if timing else 'off')
+                print colored("MiniSQL>",'cyan'),
+                query = raw_input()
+                continue
+
+            # Every statement is timed by stage, PROFILE <statement> prints the stages.
+            query, profiled = profileRequest(query)
+            timings = QueryProfile(query)
+            plan = None
+            with timings.stage('parse'):
+                parsed = db.plans.lookup(query)
+            select, tables, conditions = parsed
+            with timings.stage('plan'):
+                output = computeQuery(select, tables, conditions, db, db.session)
             if output == 'error':
                 print colored("Retry with supported operations?",'yellow')
-            elif output in ['table_created','data_inserted','data_deleted','data_truncated','table_dropped']:
-                query = 'rebase data'
-                continue
+            elif output in STATUSES:
+                pass
             elif not output:
                 print colored("ERROR",'red'), "Incorrect operations asked for! No output plausible. Retry?"
             # Print output in pretty table format.
             else:
-                table_data = []
-                for table in output:
-                    table_data.append([table+'.'+x for x in sorted(output[table].keys())])
-                    #table_data[0]+=[table+'.'+x for x in sorted(output[table].keys())]
-                    for i in range(len(output[table][output[table].keys()[0]])):
-                        row = []
-                        for col in sorted(output[table].keys()):
-                            row.append(str(output[table][col][i]))
-                        table_data.append(row)
-                    table_data.append([])
-                table = AsciiTable(table_data,' '.join(output.keys()))
-                print ""
-                print table.table
+                with timings.stage('render', consumer=True):
+                    printResult(output)
+                plan = output.plan
+            status = output if output in STATUSES+['error'] else 'rows' if output else 'error'
+            recordQuery(timings.finish(status, plan), db.activity, db.slow_log)
+            if profiled:
+                printResult(ResultStream('profile', PROFILE_LABELS, iter([timings.rows()])))
+            if timing:
+                print colored("Time:",'green'), "%.3f ms" % (timings.wall*1000)
         except:
             print colored("Retry with supported operators?",'yellow')
 
         # Take next query.
         print colored("MiniSQL>",'cyan'),
         query = raw_input()
+    db.close()
     print colored("Thanks for using MiniSQL. Exiting Now...",'yellow')
 
 def main():
     """
     Initializer Function.
     """
-    # Print Fancy Stuff
-    # TO-DO : do this.
+    parser = argparse.ArgumentParser(description='MiniSQL engine. Without a script the interactive prompt starts.')
+    parser.add_argument('path', nargs='?', help='directory of the database files, asked for when omitted')
+    parser.add_argument('script', nargs='?', help="SQL file to run in batch, - reads stdin")
+    parser.add_argument('--log-level', choices=sorted(LEVELS), help='diagnostics printed (batch default off, interactive debug)')
+    parser.add_argument('--format', choices=['csv','table'], default='csv', help='batch output format')
+    args = parser.parse_args()
+
+    if args.script is not None:
+        setLogLevel(args.log_level or 'off')
+        try:
+            database = Database(args.path)
+        except IOError as e:
+            sys.stderr.write("[ERROR] %s\n" % e.args[0])
+            sys.exit(1)
+        script = sys.stdin.read() if args.script=='-' else open(args.script).read()
+        ok = runScript(database, script, args.format)
+        database.close()
+        sys.exit(0 if ok else 1)
 
     # Initialze Database.
-    print "Please enter path to the database files :",
-    path = raw_input()
-    global database_path
-    database_path = path
-    path, data_files = fetchFiles(path)
-    database = loadDatabases(path, data_files)
-    if database=="error":
+    setLogLevel(args.log_level or 'debug')
+    if args.path is None:
+        print "Please enter path to the database files :",
+        path = raw_input()
+    else:
+        path = args.path
+    if not os.path.isdir(path):
+        path = fetchFiles(path)[0]
+    try:
+        database = Database(path)
+    except IOError:
         print 
         print colored('Review the errors and try again','yellow')
         return 
 
     print colored("           Welcome to the MiniSQL Engine\n","yellow")
     print colored("~ Enter your query on the prompt",'yellow')
-    print colored("~ rebase data : Use after every database addition/deletion",'yellow')
+    print colored("~ rebase data : Reload every table from the database files",'yellow')
+    print colored("~ show plan cache : Plan cache hits, misses and size",'yellow')
+    print colored("~ profile <query> : Time spent in every stage of a query",'yellow')
+    print colored("~ \\timing : Toggle printing the time of every query",'yellow')
     print colored("~ q : Quit\n",'yellow')
 
     # Start the query engine.
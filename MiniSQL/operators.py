@@ -0,0 +1,396 @@
+######################################
+# MiniSQL - Streaming operators      #
+######################################
+
+# Library imports
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# Rows handled per batch by every operator of a pipeline.
+MORSEL_ROWS = 65536
+# Groups a hash aggregation keeps in memory before spilling to disk.
+GROUP_BUDGET = 1 << 20
+# Hash partitions written when a hash aggregation spills.
+SPILL_PARTITIONS = 16
+# Spilled partitions are re-partitioned at most this many times.
+MAX_SPILL_DEPTH = 3
+
+# Operators pass batches of a relation between each other : a dict of aligned
+# row id arrays, one per table of the query. Nothing is computed until the
+# consumer pulls the next batch, so LIMIT stops the whole pipeline early.
+
+def batchLength(batch):
+    return len(batch.values()[0]) if batch else 0
+
+def scan(table, rows, morsel=MORSEL_ROWS):
+    """
+    Yield the given row ids of a table (an int for every row below it) in batches.
+    """
+    if isinstance(rows, (int, long)):
+        for start in xrange(0, rows, morsel):
+            yield {table: np.arange(start, min(start+morsel, rows))}
+    else:
+        for start in xrange(0, len(rows), morsel):
+            yield {table: rows[start:start+morsel]}
+
+def scanRanges(table, ranges, morsel=MORSEL_ROWS):
+    """
+    Yield the rows of a table inside the given (start, stop) ranges in batches, e.g. the blocks a zone map kept.
+    """
+    for start, stop in ranges:
+        for first in xrange(start, stop, morsel):
+            yield {table: np.arange(first, min(first+morsel, stop))}
+
+def scanRelation(relation, morsel=MORSEL_ROWS):
+    """
+    Yield an already materialized relation (e.g. a join result) in batches.
+    """
+    length = batchLength(relation)
+    for start in xrange(0, length, morsel):
+        yield dict((t, rows[start:start+morsel]) for t, rows in relation.items())
+
+def filterBatches(batches, predicate):
+    """
+    Keep the rows of every batch for which predicate(batch) is True. A None mask keeps everything.
+    """
+    for batch in batches:
+        mask = predicate(batch)
+        if mask is None:
+            yield batch
+            continue
+        keep = np.flatnonzero(mask)
+        if len(keep):
+            yield dict((t, rows[keep]) for t, rows in batch.items())
+
+def project(batches, columns):
+    """
+    Turn relation batches into lists of row tuples. columns are (table, Column) pairs.
+    """
+    for batch in batches:
+        values = [column.toList(batch[table]) for table, column in columns]
+        if values and len(values[0]):
+            yield zip(*values)
+
+def limit(batches, count):
+    """
+    Pass row batches through until count rows have been produced, then stop pulling.
+    """
+    if count<=0:
+        return
+    for batch in batches:
+        if len(batch) >= count:
+            yield batch[:count]
+            return
+        count -= len(batch)
+        yield batch
+
+class Aggregate(object):
+    """
+    Running state of one aggregate (max/min/avg/sum/count/distinct) fed one batch at a time.
+    """
+    FUNCS = ['max','min','avg','sum','count','distinct']
+
+    def __init__(self, func):
+        self.func = func
+        self.count = 0
+        self.total = 0
+        self.best = None
+        self.seen = []
+
+    def update(self, values, valid):
+        values = values[valid]
+        if not len(values):
+            return
+        best = None
+        if self.func=='max':
+            best = int(values.max())
+        elif self.func=='min':
+            best = int(values.min())
+        self.combine(len(values), int(values.sum()) if self.func in ['sum','avg'] else 0, best,
+                     np.unique(values) if self.func=='distinct' else None)
+
+    def combine(self, count, total=0, best=None, seen=None):
+        """
+        Merge a partial aggregate computed elsewhere (another batch or partition) into this one.
+        """
+        if not count:
+            return
+        self.count += count
+        self.total += total
+        if best is not None:
+            if self.best is None:
+                self.best = best
+            else:
+                self.best = max(self.best, best) if self.func=='max' else min(self.best, best)
+        if seen is not None:
+            self.seen.append(seen)
+
+    def result(self):
+        if self.func=='count':
+            return self.count
+        if self.func=='sum':
+            return self.total
+        if self.func=='distinct':
+            return np.unique(np.concatenate(self.seen)).tolist() if self.seen else []
+        if not self.count:
+            return None
+        if self.func=='avg':
+            return float(self.total)/self.count
+        return self.best
+
+def aggregateInput(batch, table, column):
+    """
+    Values and validity an aggregate reads from a batch. A None column (count(*)) counts every row.
+    """
+    if column is None:
+        rows = batch.values()[0]
+        return np.zeros(len(rows), dtype=np.int64), np.ones(len(rows), dtype=np.bool_)
+    return column.take(batch[table])
+
+def decodeResult(func, column, value):
+    """
+    An aggregate result as the values of its column read : TEXT codes (max, min, distinct) become strings.
+    """
+    return value if column is None or func=='count' else column.decode(value)
+
+def aggregateBatches(batches, aggregates):
+    """
+    Consume every batch, feeding each aggregate its column. aggregates are (Aggregate, table, Column)
+    triples. Yields the single row of results.
+    """
+    for batch in batches:
+        for state, table, column in aggregates:
+            state.update(*aggregateInput(batch, table, column))
+    yield [tuple(decodeResult(state.func, column, state.result()) for state, table, column in aggregates)]
+
+def hashKeys(keymat, seed):
+    """
+    Hash every row of a key matrix to an unsigned 64 bit value, different seeds give independent hashes.
+    """
+    h = np.full(len(keymat), 1469598103934665603 ^ seed, dtype=np.uint64)
+    for j in range(keymat.shape[1]):
+        h = (h ^ keymat[:, j].view(np.uint64)) * np.uint64(1099511628211)
+        h ^= h >> np.uint64(29)
+    return h
+
+class HashAggregate(object):
+    """
+    Hash aggregation : computes any number of aggregates per group key in a single pass over the input.
+    Keys arrive as a matrix with a (value, is valid) column pair per key column so NULLs form their own group.
+    Once the groups in memory reach the budget, rows of new groups are spilled to hash partitions on disk,
+    which are aggregated one at a time after the input is exhausted.
+    """
+    def __init__(self, funcs, budget=GROUP_BUDGET, depth=0):
+        self.funcs = funcs
+        self.budget = budget
+        self.depth = depth
+        # Group key -> slot in the state arrays of every aggregate.
+        self.groups = {}
+        self.counts = [np.zeros(0, dtype=np.int64) for func in funcs]
+        self.totals = [np.zeros(0, dtype=np.int64) for func in funcs]
+        self.bests = [np.zeros(0, dtype=np.int64) for func in funcs]
+        self.seen = [[] for func in funcs]
+        self.spill_dir = None
+        self.spill = None
+
+    def consume(self, keymat, aggvals, aggvalid):
+        if not len(keymat):
+            return
+        # Sort the batch by key so every group is a contiguous run of rows.
+        perm = np.lexsort(keymat.T[::-1])
+        keymat, aggvals, aggvalid = keymat[perm], aggvals[:, perm], aggvalid[:, perm]
+        starts = np.concatenate([[0], np.flatnonzero(np.any(keymat[1:]!=keymat[:-1], axis=1)) + 1])
+        keys = [tuple(row) for row in keymat[starts].tolist()]
+        new = [k for k in keys if k not in self.groups]
+        if len(self.groups)+len(new) > self.budget:
+            # Admit new groups while there is room, spill the rows of the others.
+            room = set(new[:max(0, self.budget-len(self.groups))])
+            admitted = np.array([k in self.groups or k in room for k in keys], dtype=np.bool_)
+            spilled = np.repeat(~admitted, np.diff(np.append(starts, len(keymat))))
+            self.spillRows(keymat[spilled], aggvals[:, spilled], aggvalid[:, spilled])
+            return self.consume(keymat[~spilled], aggvals[:, ~spilled], aggvalid[:, ~spilled])
+        if new:
+            self.grow(new)
+        slots = np.array([self.groups[k] for k in keys], dtype=np.int64)
+        for a, func in enumerate(self.funcs):
+            valid, values = aggvalid[a], aggvals[a]
+            self.counts[a][slots] += np.add.reduceat(valid.astype(np.int64), starts)
+            if func in ['sum','avg']:
+                self.totals[a][slots] += np.add.reduceat(np.where(valid, values, 0), starts)
+            elif func=='max':
+                partial = np.maximum.reduceat(np.where(valid, values, np.iinfo(np.int64).min), starts)
+                self.bests[a][slots] = np.maximum(self.bests[a][slots], partial)
+            elif func=='min':
+                partial = np.minimum.reduceat(np.where(valid, values, np.iinfo(np.int64).max), starts)
+                self.bests[a][slots] = np.minimum(self.bests[a][slots], partial)
+            elif func=='distinct' and valid.any():
+                groups = np.repeat(slots, np.diff(np.append(starts, len(keymat))))[valid]
+                pairs = np.unique(np.stack([groups, values[valid]], axis=1), axis=0)
+                bounds = np.flatnonzero(pairs[1:, 0]!=pairs[:-1, 0]) + 1
+                for part in np.split(pairs, bounds):
+                    self.seen[a][part[0, 0]].append(part[:, 1])
+
+    def grow(self, keys):
+        """
+        Give new group keys a slot, with empty state, in every aggregate.
+        """
+        for key in keys:
+            self.groups[key] = len(self.groups)
+        extra = len(keys)
+        for a, func in enumerate(self.funcs):
+            self.counts[a] = np.concatenate([self.counts[a], np.zeros(extra, dtype=np.int64)])
+            self.totals[a] = np.concatenate([self.totals[a], np.zeros(extra, dtype=np.int64)])
+            start = np.iinfo(np.int64).min if func=='max' else np.iinfo(np.int64).max
+            self.bests[a] = np.concatenate([self.bests[a], np.full(extra, start, dtype=np.int64)])
+            self.seen[a].extend([] for key in keys)
+
+    def partials(self):
+        """
+        The partial state of every group, in slot order, for merging into another HashAggregate.
+        """
+        keys = sorted(self.groups, key=self.groups.get)
+        return keys, self.counts, self.totals, self.bests, self.seen
+
+    def merge(self, keys, counts, totals, bests, seen):
+        """
+        Fold the partial state of another HashAggregate (see partials) into this one.
+        """
+        new = [k for k in keys if k not in self.groups]
+        if new:
+            self.grow(new)
+        slots = np.array([self.groups[k] for k in keys], dtype=np.int64)
+        for a, func in enumerate(self.funcs):
+            self.counts[a][slots] += counts[a]
+            self.totals[a][slots] += totals[a]
+            if func=='max':
+                self.bests[a][slots] = np.maximum(self.bests[a][slots], bests[a])
+            elif func=='min':
+                self.bests[a][slots] = np.minimum(self.bests[a][slots], bests[a])
+            elif func=='distinct':
+                for slot, parts in zip(slots.tolist(), seen[a]):
+                    self.seen[a][slot].extend(parts)
+
+    def columns(self, slots):
+        """
+        Final result of every aggregate for the given group slots, one list per aggregate.
+        """
+        columns = []
+        for a, func in enumerate(self.funcs):
+            counts = self.counts[a][slots]
+            if func=='count':
+                column = counts.tolist()
+            elif func=='sum':
+                column = self.totals[a][slots].tolist()
+            elif func=='distinct':
+                column = [np.unique(np.concatenate(self.seen[a][slot])).tolist() if self.seen[a][slot] else []
+                          for slot in slots]
+            else:
+                if func=='avg':
+                    values = (self.totals[a][slots].astype(np.float64) / np.maximum(counts, 1)).tolist()
+                else:
+                    values = self.bests[a][slots].tolist()
+                column = [value if count else None for value, count in zip(values, counts.tolist())]
+            columns.append(column)
+        return columns
+
+    def spillRows(self, keymat, aggvals, aggvalid):
+        """
+        Append rows to the partition files chosen by hashing their keys.
+        """
+        if self.spill is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='minisql-agg-')
+            self.spill = [open(os.path.join(self.spill_dir, 'part%d.npy' % p), 'wb') for p in range(SPILL_PARTITIONS)]
+        parts = hashKeys(keymat, self.depth) % np.uint64(SPILL_PARTITIONS)
+        for p in np.unique(parts):
+            sel = parts==p
+            f = self.spill[int(p)]
+            np.save(f, keymat[sel])
+            np.save(f, aggvals[:, sel])
+            np.save(f, aggvalid[:, sel])
+
+    def results(self):
+        """
+        Yield (key, aggregate results) pairs : the groups held in memory, then every spilled partition.
+        """
+        keys = sorted(self.groups)
+        slots = np.array([self.groups[key] for key in keys], dtype=np.int64)
+        for key, results in zip(keys, zip(*self.columns(slots)) if keys else []):
+            yield key, results
+        self.groups = {}
+        if self.spill is None:
+            return
+        try:
+            for f in self.spill:
+                f.close()
+                budget = self.budget if self.depth+1 < MAX_SPILL_DEPTH else float('inf')
+                child = HashAggregate(self.funcs, budget, self.depth+1)
+                size = os.path.getsize(f.name)
+                with open(f.name, 'rb') as part:
+                    while part.tell() < size:
+                        child.consume(np.load(part), np.load(part), np.load(part))
+                os.remove(f.name)
+                for result in child.results():
+                    yield result
+        finally:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+def feedGroups(state, batches, keys, aggregates):
+    """
+    Feed every batch to a HashAggregate. keys are (table, Column) pairs and aggregates
+    (func, table, Column) triples.
+    """
+    for batch in batches:
+        length = batchLength(batch)
+        keymat = np.zeros((length, 2*len(keys)), dtype=np.int64)
+        for i, (table, column) in enumerate(keys):
+            values, valid = column.take(batch[table])
+            keymat[:, 2*i] = np.where(valid, values, 0)
+            keymat[:, 2*i+1] = valid
+        aggvals = np.zeros((len(aggregates), length), dtype=np.int64)
+        aggvalid = np.zeros((len(aggregates), length), dtype=np.bool_)
+        for a, (func, table, column) in enumerate(aggregates):
+            aggvals[a], aggvalid[a] = aggregateInput(batch, table, column)
+        state.consume(keymat, aggvals, aggvalid)
+
+def groupRows(state, keys, aggregates, output):
+    """
+    Yield the groups of a fed HashAggregate as row batches. output lists ('key', i) or ('agg', i)
+    for every result column.
+    """
+    rows = []
+    for key, results in state.results():
+        key = [keys[i][1].decode(key[2*i]) if key[2*i+1] else None for i in range(len(keys))]
+        results = [decodeResult(func, column, x) for (func, table, column), x in zip(aggregates, results)]
+        rows.append(tuple(key[i] if kind=='key' else results[i] for kind, i in output))
+        if len(rows)==MORSEL_ROWS:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+def groupBatches(batches, keys, aggregates, output, budget=GROUP_BUDGET):
+    """
+    GROUP BY : feed every batch to a hash aggregation, then yield the groups as row batches.
+    """
+    state = HashAggregate([func for func, table, column in aggregates], budget)
+    feedGroups(state, batches, keys, aggregates)
+    for rows in groupRows(state, keys, aggregates, output):
+        yield rows
+
+class ResultStream(object):
+    """
+    A query result : column labels plus a generator of row batches pulled on demand.
+    """
+    def __init__(self, name, labels, batches, plan=None):
+        self.name = name
+        self.labels = labels
+        self.batches = batches
+        # The query plan whose steps produce the batches, for profiling.
+        self.plan = plan
+
+    def __iter__(self):
+        for batch in self.batches:
+            for row in batch:
+                yield row
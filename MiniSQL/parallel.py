@@ -0,0 +1,147 @@
+######################################
+# MiniSQL - Parallel execution       #
+######################################
+
+# Library imports
+import os
+import itertools
+import threading
+import multiprocessing
+import numpy as np
+
+# Worker processes used by parallel operators, 1 runs everything in the calling process.
+WORKERS = int(os.environ.get('MINISQL_WORKERS', multiprocessing.cpu_count()))
+# Tables smaller than this are not worth forking workers for.
+PARALLEL_MIN_ROWS = 1 << 19
+# Rows per task handed to a worker.
+PARALLEL_MORSEL = 1 << 18
+
+# Workers are forked when a parallel operator starts, so they inherit the columns (and memory
+# maps) of the database copy-on-write. Only the row ranges of the tasks and the (small) results
+# travel between processes.
+_work = None
+# Held while forking so concurrent sessions of a server do not hand each other's work to a pool.
+_forking = threading.Lock()
+
+def _run(task):
+    return _work(task)
+
+def setWorkers(count):
+    global WORKERS
+    WORKERS = max(1, int(count))
+
+def useParallel(rows):
+    return WORKERS > 1 and rows >= PARALLEL_MIN_ROWS
+
+def rowRanges(ranges, morsel=PARALLEL_MORSEL):
+    """
+    Split (start, stop) row ranges into tasks of at most morsel rows.
+    """
+    tasks = []
+    for start, stop in ranges:
+        for first in xrange(start, stop, morsel):
+            tasks.append((first, min(first+morsel, stop)))
+    return tasks
+
+def parallelMap(func, tasks, workers=None):
+    """
+    Yield func(task) for every task, in task order, computed by a pool of forked worker processes.
+    func and everything it references are inherited by the workers rather than pickled.
+    """
+    global _work
+    workers = min(workers or WORKERS, len(tasks))
+    if workers <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+    with _forking:
+        _work = func
+        try:
+            pool = multiprocessing.Pool(workers)
+        finally:
+            _work = None
+    try:
+        for result in pool.imap(_run, tasks):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+def parallelFilter(table, ranges, predicate, tally=None):
+    """
+    Filter the given row ranges of a table in the workers. predicate(batch) returns a mask or None
+    (everything matches). Yields the surviving rows of every task as batches, in row order.
+    tally, if given, is called with the rows every task scanned and the rows that matched.
+    """
+    def work(task):
+        rows = np.arange(task[0], task[1])
+        mask = predicate({table: rows})
+        return rows if mask is None else rows[mask]
+    tasks = rowRanges(ranges)
+    for (start, stop), rows in itertools.izip(tasks, parallelMap(work, tasks)):
+        if tally is not None:
+            tally(stop-start, len(rows))
+        if len(rows):
+            yield {table: rows}
+
+def parallelAggregate(table, ranges, predicate, aggregates, state, tally=None):
+    """
+    Filter and aggregate row ranges in the workers : each one returns the partial state of every
+    aggregate for its rows, which are merged into state (a list of Aggregate objects).
+    aggregates are (func, table, Column) triples. Yields the single row of results. tally is
+    called as for parallelFilter.
+    """
+    from operators import Aggregate, aggregateInput, decodeResult
+    def work(task):
+        rows = np.arange(task[0], task[1])
+        mask = predicate({table: rows})
+        batch = {table: rows if mask is None else rows[mask]}
+        partials = []
+        for func, t, column in aggregates:
+            partial = Aggregate(func)
+            partial.update(*aggregateInput(batch, t, column))
+            partials.append((partial.count, partial.total, partial.best, np.concatenate(partial.seen) if partial.seen else None))
+        return len(rows), len(batch[table]), partials
+    for scanned, matched, partials in parallelMap(work, rowRanges(ranges)):
+        if tally is not None:
+            tally(scanned, matched)
+        for target, partial in zip(state, partials):
+            target.combine(*partial)
+    yield [tuple(decodeResult(target.func, column, target.result()) for target, (func, t, column) in zip(state, aggregates))]
+
+def parallelGroup(table, ranges, predicate, keys, aggregates, output, tally=None):
+    """
+    Hash GROUP BY over row ranges in the workers : each one aggregates its rows into partial groups,
+    which are merged by group key. keys, aggregates and output are as for operators.groupBatches,
+    tally as for parallelFilter.
+    """
+    from operators import HashAggregate, feedGroups, groupRows
+    funcs = [func for func, t, column in aggregates]
+    def work(task):
+        rows = np.arange(task[0], task[1])
+        mask = predicate({table: rows})
+        matched = rows if mask is None else rows[mask]
+        partial = HashAggregate(funcs, float('inf'))
+        feedGroups(partial, [{table: matched}], keys, aggregates)
+        return len(rows), len(matched), partial.partials()
+    state = HashAggregate(funcs, float('inf'))
+    for scanned, matched, partials in parallelMap(work, rowRanges(ranges)):
+        if tally is not None:
+            tally(scanned, matched)
+        state.merge(*partials)
+    for rows in groupRows(state, keys, aggregates, output):
+        yield rows
+
+def parallelProbe(table, probe):
+    """
+    Probe a hash table built by joins.buildHashTable with the keys in probe, in the workers.
+    Returns the matching (build positions, probe positions).
+    """
+    from joins import probeHashTable
+    def work(task):
+        build_pos, probe_pos = probeHashTable(table, probe[task[0]:task[1]])
+        return build_pos, probe_pos+task[0]
+    results = list(parallelMap(work, rowRanges([(0, len(probe))])))
+    if not results:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
@@ -0,0 +1,162 @@
+######################################
+# MiniSQL - Plan cache               #
+######################################
+
+# Library imports
+import re
+import sys
+import threading
+from StringIO import StringIO
+from collections import OrderedDict
+
+# Parsed plans kept before the least recently used one is evicted.
+CACHE_SIZE = 256
+
+# Literals of a statement : quoted strings, integers (with their sign) and ? parameters.
+LITERAL = re.compile(r'\'[^\']*\'|"[^"]*"|(?<![\w.])-?\d+(?![\w.])|\?')
+# Stand-ins the query is parsed with on a miss, bound back to the literals on every use.
+NUMBER_SENTINEL = re.compile(r'(?<![\w.])-?98765(\d{8})(?![\w.])')
+STRING_SENTINEL = re.compile(r'__param(\d+)__')
+SENTINEL_BASE = 9876500000000
+# Statements handled by the cache itself are never cached.
+UNCACHED = re.compile(r'^\s*(prepare|execute|deallocate)\s', re.I)
+
+def normalizeQuery(query):
+    """
+    Split a query into its shape, every literal replaced by a ? slot, and the literals in order.
+    Queries differing only in their literals share a shape.
+    """
+    literals = []
+    def slot(match):
+        literal = match.group(0)
+        literals.append(literal)
+        if literal[0] in '\'"':
+            return "'?'"
+        return '-?' if literal[0]=='-' else '?'
+    shape = LITERAL.sub(slot, query.strip().rstrip(';').strip())
+    return re.sub(r'\s+', ' ', shape), literals
+
+def sentinelQuery(shape, literals):
+    """
+    Rebuild a query from its shape with a distinct sentinel in every slot.
+    """
+    slots = iter(range(len(literals)))
+    def sentinel(match):
+        i = next(slots)
+        if match.group(0)=="'?'":
+            return "'__param%d__'" % i
+        return '%s%d' % ('-' if match.group(0)[0]=='-' else '', SENTINEL_BASE+i)
+    return re.sub(r"'\?'|-?\?", sentinel, shape)
+
+def unquote(literal):
+    return literal[1:-1] if literal[0] in '\'"' else literal
+
+def bind(plan, literals):
+    """
+    Copy of a cached plan with the sentinels replaced by this query's literals.
+    """
+    if isinstance(plan, basestring):
+        plan = NUMBER_SENTINEL.sub(lambda m: literals[int(m.group(1))], plan)
+        return STRING_SENTINEL.sub(lambda m: unquote(literals[int(m.group(1))]), plan)
+    if isinstance(plan, (int, long)) and 0 <= abs(plan)-SENTINEL_BASE < len(literals):
+        return int(literals[abs(plan)-SENTINEL_BASE])
+    if isinstance(plan, list):
+        return [bind(x, literals) for x in plan]
+    if isinstance(plan, tuple):
+        return tuple(bind(x, literals) for x in plan)
+    return plan
+
+def quietly(func, *args):
+    """
+    Call func with its prints discarded.
+    """
+    if hasattr(sys.stdout, 'capture'):
+        # Under a server stdout routes the prints of every session separately.
+        with sys.stdout.capture():
+            return func(*args)
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        return func(*args)
+    finally:
+        sys.stdout = stdout
+
+class PlanCache(object):
+    """
+    Bounded LRU cache of parsed queries keyed by their literal-normalized text, so repeated query
+    shapes skip tokenizing.
+    """
+    def __init__(self, parse, capacity=CACHE_SIZE):
+        self.parse = parse
+        self.capacity = capacity
+        self.plans = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Sessions of a server share the cache.
+        self.lock = threading.RLock()
+
+    def lookup(self, query):
+        """
+        Parse a query through the cache. Returns what parse would, "error" included.
+        """
+        with self.lock:
+            return self.cachedParse(query)
+
+    def cachedParse(self, query):
+        if UNCACHED.match(query):
+            return self.parse(query)
+        shape, literals = normalizeQuery(query)
+        if '?' in literals:
+            raise ValueError("Parameters (?) are only allowed in prepared statements")
+        plan = self.plans.pop(shape, None)
+        if plan is None:
+            # The query itself is parsed for its errors and echo, the sentinel version becomes the plan.
+            self.misses += 1
+            parsed = self.parse(query)
+            if parsed=="error":
+                return parsed
+            plan = quietly(self.parse, sentinelQuery(shape, literals))
+            if plan=="error":
+                return parsed
+        else:
+            self.hits += 1
+        self.plans[shape] = plan
+        if len(self.plans) > self.capacity:
+            self.plans.popitem(last=False)
+        return bind(plan, literals)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.plans), 'capacity': self.capacity}
+
+class PreparedStatements(object):
+    """
+    The prepared statements of one session, by name.
+    """
+    def __init__(self):
+        self.prepared = {}
+
+    def __len__(self):
+        return len(self.prepared)
+
+    def prepare(self, name, query):
+        """
+        Remember a statement with ? parameters under a name. Returns its number of parameters.
+        """
+        self.prepared[name] = query
+        return normalizeQuery(query)[1].count('?')
+
+    def statement(self, name, params):
+        """
+        Text of a prepared statement with its ? parameters replaced, in order, by the given literals.
+        """
+        if name not in self.prepared:
+            raise KeyError("No prepared statement %s" % name)
+        query = self.prepared[name]
+        expected = normalizeQuery(query)[1].count('?')
+        if len(params)!=expected:
+            raise ValueError("%s expects %s parameters, got %s" % (name, expected, len(params)))
+        params = iter(params)
+        return LITERAL.sub(lambda m: next(params) if m.group(0)=='?' else m.group(0), query)
+
+    def deallocate(self, name):
+        return self.prepared.pop(name, None) is not None
@@ -0,0 +1,255 @@
+######################################
+# MiniSQL - Statistics and planner   #
+######################################
+
+# Library imports
+import sys
+import time
+import numpy as np
+
+# Buckets of the equi-depth histogram kept per column.
+HISTOGRAM_BUCKETS = 32
+# Smallest hashes kept by the distinct count sketch.
+SKETCH_SIZE = 256
+# Fraction of rows changed after which histogram and sketch are rebuilt.
+RESTAT_FRACTION = 0.2
+# An index is used when it is estimated to return less than this fraction of the table,
+# above it gathering the rows costs more than scanning the whole column.
+INDEX_SELECTIVITY = 0.2
+# Selectivity assumed for comparisons between two columns.
+RANGE_SELECTIVITY = 1.0/3
+
+def hashValues(values):
+    """
+    Mix int64 values into well spread unsigned 64 bit hashes (splitmix64 finalizer).
+    """
+    h = values.astype(np.int64).view(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+def sketchValues(values, sketch=None):
+    """
+    K minimum values sketch : the SKETCH_SIZE smallest distinct hashes of the values, merged with an older sketch.
+    """
+    h = np.unique(hashValues(values))[:SKETCH_SIZE]
+    if sketch is not None:
+        h = np.concatenate([sketch, h])
+    return np.unique(h)[:SKETCH_SIZE]
+
+class ColumnStats(object):
+    """
+    Statistics of one column : row and NULL counts, min/max, a distinct count sketch and an
+    equi-depth histogram. Counts and bounds follow every insert and delete, the sketch and
+    histogram are rebuilt once enough of the column changed.
+    """
+    def __init__(self, column):
+        values = column.values[column.valid]
+        self.rows = len(column)
+        self.nulls = self.rows-len(values)
+        self.min = int(values.min()) if len(values) else None
+        self.max = int(values.max()) if len(values) else None
+        self.sketch = sketchValues(values)
+        self.histogram = np.percentile(values, np.linspace(0, 100, HISTOGRAM_BUCKETS+1), interpolation='nearest') if len(values) else None
+        self.built = self.rows
+        self.changed = 0
+
+    def insertRows(self, values, valid):
+        values = np.asarray(values, dtype=np.int64)[np.asarray(valid, dtype=np.bool_)]
+        self.nulls += len(valid)-len(values)
+        self.rows += len(valid)
+        self.changed += len(valid)
+        if len(values):
+            low, high = int(values.min()), int(values.max())
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+            self.sketch = sketchValues(values, self.sketch)
+
+    def deleteRows(self, column):
+        """
+        Follow a delete. min/max stay valid (if loose) bounds until the next rebuild.
+        """
+        self.changed += self.rows-len(column)
+        self.rows = len(column)
+        self.nulls = self.rows-int(column.valid.sum())
+
+    def stale(self):
+        return self.changed > RESTAT_FRACTION*max(self.built, 1)
+
+    def distinct(self):
+        """
+        Estimated number of distinct non-NULL values.
+        """
+        if len(self.sketch) < SKETCH_SIZE:
+            return len(self.sketch)
+        return max(SKETCH_SIZE, int((SKETCH_SIZE-1)*2.0**64/float(self.sketch[-1])))
+
+    def excludes(self, delim, value):
+        """
+        True if min/max prove no row can satisfy `column <delim> value`.
+        """
+        if self.min is None:
+            return True
+        if delim=='=':
+            return value < self.min or value > self.max
+        if delim=='<':
+            return value <= self.min
+        return value >= self.max
+
+    def fraction(self, delim, value):
+        """
+        Estimated fraction of the rows satisfying `column <delim> value`.
+        """
+        if not self.rows or self.excludes(delim, value):
+            return 0.0
+        present = float(self.rows-self.nulls)/self.rows
+        bounds = self.histogram
+        # Values repeated across histogram bounds are frequent ones, each bound is 1/BUCKETS of the rows.
+        equal = max(1.0/max(self.distinct(), 1), (np.count_nonzero(bounds==value)-1.0)/HISTOGRAM_BUCKETS)
+        if delim=='=':
+            return present*min(equal, 1.0)
+        i = np.searchsorted(bounds, value, 'right')-1
+        below = float(i)/HISTOGRAM_BUCKETS
+        if i < HISTOGRAM_BUCKETS and bounds[i+1] > bounds[i]:
+            below += (value-bounds[i])/float(bounds[i+1]-bounds[i])/HISTOGRAM_BUCKETS
+        below = min(max(below, 0.0), 1.0)
+        if delim=='<':
+            return present*max(below-(equal if bounds[i]==value else 0.0), 0.0)
+        return present*max(1.0-below, 0.0)
+
+def columnStats(column):
+    """
+    Statistics of a column, gathered on first use and again whenever they went stale.
+    """
+    if column.stats is None or column.stats.stale():
+        column.stats = ColumnStats(column)
+    return column.stats
+
+def tableRows(table):
+    return len(table[table.keys()[0]]) if table else 0
+
+def conditionFraction(table, cond):
+    """
+    Estimated selectivity of a (column, operator, value) condition of a table.
+    Comparisons against other columns get a fixed guess.
+    """
+    col, delim, value = cond
+    if isinstance(value, str):
+        return 1.0/max(columnStats(table[col]).distinct(), 1) if delim=='=' else RANGE_SELECTIVITY
+    return columnStats(table[col]).fraction(delim, value)
+
+def chooseAccess(table, conds):
+    """
+    Pick the access path for an AND group of conditions : the index lookup returning the fewest
+    rows, or None when scanning is estimated to be cheaper. Returns (condition, index, rows).
+    """
+    rows = tableRows(table)
+    best = None
+    for cond in conds:
+        col, delim, value = cond
+        if isinstance(value, str):
+            continue
+        estimate = conditionFraction(table, cond)*rows
+        for index in table[col].indexes.values():
+            if not index.supports(delim):
+                continue
+            rank = (estimate, index.kind!='hash')
+            if best is None or rank < best[0]:
+                best = (rank, cond, index)
+    if best is None or best[0][0] > INDEX_SELECTIVITY*rows:
+        return None
+    return best[1], best[2], best[0][0]
+
+def joinEstimate(database, left_rows, right_rows, pred):
+    """
+    Estimated output of joining two inputs on a (table, column, operator, table, column) predicate.
+    """
+    if pred is None:
+        return left_rows*right_rows
+    if pred[2]!='=':
+        return left_rows*right_rows*RANGE_SELECTIVITY
+    distinct = max(columnStats(database[pred[0]][pred[1]]).distinct(), columnStats(database[pred[3]][pred[4]]).distinct(), 1)
+    return left_rows*right_rows/float(distinct)
+
+def batchBytes(batch, relation=True):
+    """
+    Size of a batch : the row id arrays of a relation batch, or an estimate for a batch of row tuples.
+    """
+    if relation:
+        return sum(rows.nbytes for rows in batch.values())
+    return sys.getsizeof(batch)+len(batch)*sys.getsizeof(batch[0]) if batch else 0
+
+class Plan(object):
+    """
+    The steps chosen for a query, each with its estimated and (once the query ran) actual rows.
+    """
+    def __init__(self):
+        self.steps = []
+        # (step, timing) of the counted steps, in pipeline order : each one pulls from the one before.
+        self.timed = []
+
+    def add(self, op, detail, estimate, actual=None):
+        step = [op, detail, int(round(estimate)), actual]
+        self.steps.append(step)
+        return step
+
+    def tally(self, *steps):
+        """
+        A callback adding row counts to the actual rows of steps, for operators that read rows
+        outside the batch pipeline (parallel workers). Called with one count per step.
+        """
+        for step in steps:
+            step[3] = 0
+        def add(*counts):
+            for step, rows in zip(steps, counts):
+                step[3] += rows
+        return add
+
+    def count(self, batches, step, relation=True):
+        """
+        Pass batches through, recording the rows that flowed by as the actual count of a step,
+        the time spent producing them (steps feeding this one included) and their size.
+        """
+        timing = {'wall': 0.0, 'cpu': 0.0, 'bytes': 0}
+        # Steps are registered as the pipeline is built, before any batch is pulled.
+        self.timed.append((step, timing))
+        return self.timeBatches(batches, step, timing, relation)
+
+    def timeBatches(self, batches, step, timing, relation):
+        step[3] = 0
+        batches = iter(batches)
+        while True:
+            wall, cpu = time.time(), time.clock()
+            try:
+                batch = next(batches)
+            finally:
+                timing['wall'] += time.time()-wall
+                timing['cpu'] += time.clock()-cpu
+            step[3] += len(batch.values()[0]) if relation and batch else len(batch)
+            timing['bytes'] += batchBytes(batch, relation)
+            yield batch
+
+    def profile(self):
+        """
+        Time spent in every counted step alone, with the rows it pulled and produced :
+        (op, detail, wall, cpu, rows in, rows out, bytes out) tuples.
+        """
+        stages = []
+        previous = None
+        for step, timing in self.timed:
+            wall, cpu = timing['wall'], timing['cpu']
+            if previous is not None:
+                wall -= previous[1]['wall']
+                cpu -= previous[1]['cpu']
+            stages.append((step[0], step[1], max(wall, 0.0), max(cpu, 0.0), previous[0][3] if previous else None, step[3], timing['bytes']))
+            previous = (step, timing)
+        return stages
+
+    def pulled(self):
+        """
+        Time the last counted step spent producing its batches, the whole pipeline included.
+        """
+        return (self.timed[-1][1]['wall'], self.timed[-1][1]['cpu']) if self.timed else (0.0, 0.0)
+
+    def rows(self):
+        return [(op, detail, estimate, '-' if actual is None else actual) for op, detail, estimate, actual in self.steps]
@@ -0,0 +1,187 @@
+######################################
+# MiniSQL - Profiling and counters   #
+######################################
+
+# Library imports
+import os
+import re
+import json
+import time
+import resource
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Statements slower than this are written to the slow query log.
+SLOW_QUERY_MS = float(os.environ.get('MINISQL_SLOW_QUERY_MS', 1000))
+# The log file is rolled over to <file>.1 once it grows past this size.
+SLOW_LOG_BYTES = 1 << 20
+# Slow queries kept in memory.
+SLOW_LOG_ENTRIES = 100
+SLOW_LOG_FILE = 'slow_queries.log'
+
+# PROFILE <statement> runs a statement and reports where its time went.
+PROFILE = re.compile(r'^\s*profile\s+', re.I)
+PROFILE_LABELS = ['stage','detail','wall ms','cpu ms','rows in','rows out','bytes out']
+
+def profileRequest(query):
+    """
+    Split PROFILE off a statement. Returns (statement, whether it was asked to be profiled).
+    """
+    match = PROFILE.match(query)
+    return (query[match.end():], True) if match else (query, False)
+
+def peakRss():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+class QueryProfile(object):
+    """
+    Wall and CPU time of the stages of one statement (parse, plan, then the stage consuming
+    the result) plus, from the query plan, the time and rows of every operator. Times of
+    worker processes are not included in the CPU time.
+    """
+    def __init__(self, query):
+        self.query = query
+        self.stages = []
+        self.plan = None
+        self.status = None
+        self.started = time.time()
+        self.cpu_started = time.clock()
+        self.rss = peakRss()
+        self.wall = self.cpu = 0.0
+        self.rss_growth = 0
+
+    @contextmanager
+    def stage(self, name, consumer=False):
+        """
+        Time a stage. A consumer stage pulls the result batches, the operators' time is taken out of it.
+        """
+        stage = {'stage': name, 'consumer': consumer, 'wall': 0.0, 'cpu': 0.0}
+        self.stages.append(stage)
+        wall, cpu = time.time(), time.clock()
+        try:
+            yield stage
+        finally:
+            stage['wall'] = time.time()-wall
+            stage['cpu'] = time.clock()-cpu
+
+    def finish(self, status, plan=None):
+        self.status = status
+        self.plan = plan
+        self.wall = time.time()-self.started
+        self.cpu = time.clock()-self.cpu_started
+        self.rss_growth = peakRss()-self.rss
+        return self
+
+    def rows(self):
+        """
+        The profile as (stage, detail, wall ms, cpu ms, rows in, rows out, bytes out) rows, operators
+        listed before the stage that pulled their batches.
+        """
+        rows = []
+        for stage in self.stages:
+            wall, cpu = stage['wall'], stage['cpu']
+            if stage['consumer'] and self.plan is not None:
+                for op, detail, op_wall, op_cpu, rows_in, rows_out, size in self.plan.profile():
+                    rows.append((op, detail, round(op_wall*1000, 3), round(op_cpu*1000, 3), rows_in, rows_out, size))
+                pulled = self.plan.pulled()
+                wall, cpu = max(wall-pulled[0], 0.0), max(cpu-pulled[1], 0.0)
+            rows.append((stage['stage'], '', round(wall*1000, 3), round(cpu*1000, 3), None, None, None))
+        rows.append(('total', 'peak RSS +%s bytes' % self.rss_growth, round(self.wall*1000, 3), round(self.cpu*1000, 3), None, None, None))
+        return [tuple('-' if x is None else x for x in row) for row in rows]
+
+    def asDict(self):
+        return {'query': self.query, 'status': self.status, 'started': self.started,
+                'wall_ms': round(self.wall*1000, 3), 'cpu_ms': round(self.cpu*1000, 3),
+                'peak_rss_growth': self.rss_growth,
+                'stages': [dict(zip(PROFILE_LABELS, row)) for row in self.rows()]}
+
+class SlowQueryLog(object):
+    """
+    The statements slower than the threshold : the last SLOW_LOG_ENTRIES in memory, every one
+    appended to a JSON lines file rolled over once it reaches SLOW_LOG_BYTES.
+    """
+    def __init__(self, path=None, threshold_ms=SLOW_QUERY_MS):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self.entries = deque(maxlen=SLOW_LOG_ENTRIES)
+        self.lock = threading.Lock()
+
+    def record(self, profile):
+        if profile.wall*1000 < self.threshold_ms:
+            return False
+        entry = profile.asDict()
+        with self.lock:
+            self.entries.append(entry)
+            if self.path is None:
+                return True
+            if os.path.isfile(self.path) and os.path.getsize(self.path) >= SLOW_LOG_BYTES:
+                os.rename(self.path, self.path+'.1')
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry)+'\n')
+        return True
+
+class Counters(object):
+    """
+    Counters of a database since it was opened : statements, errors, slow statements, time spent,
+    and its last load.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.queries = 0
+        self.errors = 0
+        self.slow = 0
+        self.wall = 0.0
+        self.load_seconds = None
+        self.load_rows = 0
+
+    def loaded(self, seconds, rows):
+        self.load_seconds = seconds
+        self.load_rows = rows
+
+    def record(self, profile, slow):
+        with self.lock:
+            self.queries += 1
+            self.errors += profile.status=='error'
+            self.slow += slow
+            self.wall += profile.wall
+
+    def export(self, cache_stats=None):
+        """
+        The counters as a dict, with rates derived from them and the plan cache statistics if given.
+        """
+        uptime = time.time()-self.started
+        counters = {'uptime_seconds': round(uptime, 3), 'queries': self.queries, 'errors': self.errors,
+                    'slow_queries': self.slow, 'queries_per_sec': round(self.queries/uptime, 3) if uptime else 0.0,
+                    'avg_query_ms': round(self.wall*1000/self.queries, 3) if self.queries else 0.0,
+                    'load_seconds': None if self.load_seconds is None else round(self.load_seconds, 3),
+                    'load_rows': self.load_rows}
+        if cache_stats is not None:
+            lookups = cache_stats['hits']+cache_stats['misses']
+            counters['plan_cache_hits'] = cache_stats['hits']
+            counters['plan_cache_misses'] = cache_stats['misses']
+            counters['plan_cache_hit_rate'] = round(float(cache_stats['hits'])/lookups, 4) if lookups else 0.0
+        return counters
+
+# Functions called with the QueryProfile of every finished statement.
+QUERY_HOOKS = []
+
+def addQueryHook(func):
+    QUERY_HOOKS.append(func)
+
+def removeQueryHook(func):
+    QUERY_HOOKS.remove(func)
+
+def recordQuery(profile, counters, slow_log):
+    """
+    Account a finished statement in the counters and slow query log of its database, then call the hooks.
+    """
+    slow = slow_log.record(profile)
+    counters.record(profile, slow)
+    for hook in QUERY_HOOKS:
+        hook(profile)
@@ -0,0 +1,50 @@
+######################################
+# MiniSQL - Statement results        #
+######################################
+
+# Library imports
+import numpy as np
+from collections import OrderedDict
+from columnStore import Column
+
+class QueryError(Exception):
+    """
+    A statement the engine rejected. messages holds what the engine printed while running it.
+    """
+    def __init__(self, message, messages=''):
+        Exception.__init__(self, message)
+        self.messages = messages
+
+class Result(object):
+    """
+    Answer to one statement : a status (the statement kind, or 'rows'), column labels and rows
+    as tuples of ints, floats, strings, lists (distinct) and None for NULL.
+    """
+    def __init__(self, reply):
+        self.status = reply['status']
+        self.labels = reply.get('labels', [])
+        self.rows = [tuple(row) for row in reply.get('rows', [])]
+        self.messages = reply.get('messages', '')
+        # Stage timings, when the statement was profiled.
+        self.profile = reply.get('profile')
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def columns(self):
+        """
+        The result column by column. Integer columns become Columns (integer buffer plus validity),
+        the others lists.
+        """
+        columns = OrderedDict()
+        for i, label in enumerate(self.labels):
+            values = [row[i] for row in self.rows]
+            if all(isinstance(x, (int, long)) or x is None for x in values):
+                valid = np.array([x is not None for x in values], dtype=np.bool_)
+                columns[label] = Column([0 if x is None else x for x in values], valid)
+            else:
+                columns[label] = values
+        return columns
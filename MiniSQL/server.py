@@ -0,0 +1,186 @@
+######################################
+# MiniSQL - Query server             #
+######################################
+
+# Library imports
+import re
+import sys
+import signal
+import threading
+import SocketServer
+from StringIO import StringIO
+from contextlib import contextmanager
+from termcolor import colored
+import miniSql
+from client import sendMessage, receiveMessage, DEFAULT_PORT
+
+# Statements that only read the database and may run alongside each other.
+READ_QUERY = re.compile(r'^\s*(profile\s+)?(select|explain|show)\s', re.I)
+COLOR_CODE = re.compile(r'\x1b\[[0-9;]*m')
+
+class ReadWriteLock(object):
+    """
+    Any number of readers or a single writer. Waiting writers hold back new readers so a
+    steady stream of reads can not starve them.
+    """
+    def __init__(self):
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = False
+        self.waiting = 0
+
+    @contextmanager
+    def reading(self):
+        with self.cond:
+            while self.writer or self.waiting:
+                self.cond.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.readers -= 1
+                if not self.readers:
+                    self.cond.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self.cond:
+            self.waiting += 1
+            while self.writer or self.readers:
+                self.cond.wait()
+            self.waiting -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.writer = False
+                self.cond.notify_all()
+
+class SessionOutput(object):
+    """
+    Stand-in for sys.stdout sending the prints of every thread running a statement to that
+    statement's buffer, and everything else to the real stdout.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buf = getattr(self.local, 'buffer', None)
+        (buf if buf is not None else self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    @contextmanager
+    def capture(self):
+        previous = getattr(self.local, 'buffer', None)
+        self.local.buffer = StringIO()
+        try:
+            yield self.local.buffer
+        finally:
+            self.local.buffer = previous
+
+class Engine(object):
+    """
+    The database of a server, loaded once and shared by every session. Reads run concurrently,
+    writes one at a time with no read in progress. The plan cache is shared by all sessions,
+    every session keeps its own BEGIN/COMMIT batch and prepared statements.
+    """
+    def __init__(self, database_path):
+        self.lock = ReadWriteLock()
+        if not isinstance(sys.stdout, SessionOutput):
+            sys.stdout = SessionOutput(sys.stdout)
+        self.database = miniSql.Database(database_path)
+
+    def execute(self, query, session):
+        """
+        Run one statement of a session. Returns the reply sent to the client : its status, result
+        rows and the messages the engine printed.
+        """
+        with sys.stdout.capture() as out:
+            try:
+                if READ_QUERY.match(query):
+                    with self.lock.reading():
+                        reply = self.database.run(query, session=session)
+                else:
+                    with self.lock.writing():
+                        reply = self.database.run(query, session=session)
+            except Exception as e:
+                reply = {'status': 'error', 'error': str(e)}
+        reply['messages'] = COLOR_CODE.sub('', out.getvalue())
+        return reply
+
+    def disconnect(self, session):
+        """
+        Commit the batch a session left open when its client hung up.
+        """
+        with sys.stdout.capture():
+            with self.lock.writing():
+                self.database.endSession(session)
+
+    def close(self):
+        with self.lock.writing():
+            self.database.close()
+
+class SessionHandler(SocketServer.BaseRequestHandler):
+    """
+    One client connection : statements are read and answered in order until the client hangs up.
+    """
+    def handle(self):
+        session = miniSql.Session()
+        try:
+            while True:
+                message = receiveMessage(self.request)
+                if message is None:
+                    return
+                sendMessage(self.request, self.server.engine.execute(message['query'], session))
+        finally:
+            self.server.engine.disconnect(session)
+
+class TCPQueryServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class UnixQueryServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+def startServer(engine, address):
+    """
+    Serve an engine at a (host, port) pair or a Unix socket path, one thread per session.
+    """
+    server_class = TCPQueryServer if isinstance(address, tuple) else UnixQueryServer
+    server = server_class(address, SessionHandler)
+    server.engine = engine
+    return server
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def main():
+    """
+    server.py <database path> [port | unix socket path]
+    """
+    if len(sys.argv) < 2:
+        print colored("[ERROR]",'red'),"Usage : server.py <database path> [port | unix socket path]"
+        return
+    address = ('localhost', DEFAULT_PORT)
+    if len(sys.argv) > 2:
+        address = ('localhost', int(sys.argv[2])) if sys.argv[2].isdigit() else sys.argv[2]
+    engine = Engine(sys.argv[1])
+    server = startServer(engine, address)
+    print colored("[INFO]",'green'),"Serving %s on %s" % (sys.argv[1], address)
+    # SIGTERM shuts down like Ctrl-C, checkpointing the database.
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    engine.close()
+    print colored("Thanks for using MiniSQL. Exiting Now...",'yellow')
+
+if __name__=='__main__':
+    main()
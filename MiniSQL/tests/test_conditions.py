@@ -0,0 +1,87 @@
+######################################
+# MiniSQL - Condition tests          #
+######################################
+
+# Library imports
+import os
+import shutil
+import tempfile
+import unittest
+
+# Package imports
+from log import setLogLevel
+from miniSql import Database
+from results import QueryError
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'databases')
+
+class ColumnConditionTest(unittest.TestCase):
+    """
+    DELETE removes exactly the rows SELECT finds, column comparisons included, and names that
+    are no column are refused instead of ignored.
+    """
+    def setUp(self):
+        setLogLevel('off')
+        self.path = os.path.join(tempfile.mkdtemp(), 'db')
+        shutil.copytree(SAMPLE, self.path)
+        self.database = Database(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def count(self, where):
+        return self.database.execute("select count(*) from table1 where %s;" % where).rows[0][0]
+
+    def assertDeletesSelected(self, where):
+        total = self.count('A=A')
+        matching = self.count(where)
+        self.assertTrue(matching > 0)
+        self.database.execute("delete from table1 where %s;" % where)
+        self.assertEqual(self.count(where), 0)
+        self.assertEqual(self.count('A=A'), total-matching)
+
+    def testColumnComparisonWithConstant(self):
+        self.assertDeletesSelected('A>0 and A<B')
+
+    def testColumnComparisonAlone(self):
+        self.assertDeletesSelected('A<B')
+
+    def testColumnComparisonInOr(self):
+        self.assertDeletesSelected('A>900 or C<B')
+
+    def testUnknownNamesRejected(self):
+        total = self.count('A=A')
+        for where in ['A=NULL', 'A=Z', 'Z=1', 'A<0 and B=NULL']:
+            self.assertRaises(QueryError, self.database.execute, "select A from table1 where %s;" % where)
+            self.assertRaises(QueryError, self.database.execute, "delete from table1 where %s;" % where)
+        self.assertEqual(self.count('A=A'), total)
+
+class QuotedConnectorTest(unittest.TestCase):
+    """
+    AND/OR inside a quoted literal is part of the literal, not a connector.
+    """
+    def setUp(self):
+        setLogLevel('off')
+        self.path = os.path.join(tempfile.mkdtemp(), 'db')
+        shutil.copytree(SAMPLE, self.path)
+        self.database = Database(self.path)
+        self.database.execute("create table songs (id INT, genre TEXT);")
+        self.database.execute("insert into songs values (1, 'rock and roll'), (2, 'this or that'), (3, 'rock');")
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def ids(self, where):
+        return sorted(row[0] for row in self.database.execute("select id from songs where %s;" % where).rows)
+
+    def testSelect(self):
+        self.assertEqual(self.ids("genre='rock and roll'"), [1])
+        self.assertEqual(self.ids("genre = 'this or that' or genre='rock'"), [2, 3])
+        self.assertEqual(self.ids("id>0 and genre=\"rock and roll\""), [1])
+
+    def testDelete(self):
+        self.database.execute("delete from songs where genre='rock and roll';")
+        self.assertEqual(self.ids("id>0"), [2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
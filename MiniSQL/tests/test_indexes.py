@@ -0,0 +1,50 @@
+######################################
+# MiniSQL - Index tests              #
+######################################
+
+# Library imports
+import unittest
+import numpy as np
+
+# Package imports
+from columnStore import Column
+from indexes import buildIndex
+
+class HashIndexTest(unittest.TestCase):
+    """
+    Hash index buckets kept in step with a btree index through inserts and deletes.
+    """
+    def setUp(self):
+        self.column = Column(np.array([3, 1, 3, 2, 1, 3]))
+        self.hash = buildIndex('h', 't', 'a', 'hash', self.column)
+        self.btree = buildIndex('b', 't', 'a', 'btree', self.column)
+        self.column.indexes = {'h': self.hash, 'b': self.btree}
+
+    def assertSameLookups(self, values):
+        for value in values:
+            self.assertEqual(self.hash.lookup('=', value).tolist(), self.btree.lookup('=', value).tolist())
+
+    def testBuild(self):
+        self.assertEqual(self.hash.lookup('=', 3).tolist(), [0, 2, 5])
+        self.assertSameLookups([0, 1, 2, 3, 4])
+
+    def testInsert(self):
+        self.column.append(np.array([5, 1, 4, 7]), np.array([True, True, True, False]))
+        self.assertEqual(self.hash.lookup('=', 1).tolist(), [1, 4, 7])
+        self.assertSameLookups([0, 1, 2, 3, 4, 5, 7])
+
+    def testDelete(self):
+        self.column.delete(np.array([True, False, True, True, True, False]))
+        self.assertEqual(self.hash.lookup('=', 3).tolist(), [0, 1])
+        self.assertSameLookups([0, 1, 2, 3])
+
+    def testOrderRoundTrip(self):
+        self.assertEqual(sorted(self.hash.order.tolist()), range(6))
+        self.assertEqual(self.hash.order.tolist(), self.btree.order.tolist())
+
+    def testRangeRejected(self):
+        self.assertFalse(self.hash.supports('<'))
+        self.assertRaises(ValueError, self.hash.lookup, '>', 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+######################################
+# MiniSQL - Planner tests            #
+######################################
+
+# Library imports
+import unittest
+import numpy as np
+
+# Package imports
+from columnStore import Column
+from planner import ColumnStats
+
+class SkewedFractionTest(unittest.TestCase):
+    """
+    Range estimates on a column where one value fills most histogram bounds.
+    """
+    def setUp(self):
+        # 900 zeros then 1..100 : 0 is 90% of the rows.
+        self.stats = ColumnStats(Column(np.array([0]*900+range(1, 101))))
+
+    def testGreaterThanFrequentValue(self):
+        self.assertAlmostEqual(self.stats.fraction('>', 0), 0.1, delta=0.05)
+
+    def testLessThanAfterFrequentValue(self):
+        self.assertAlmostEqual(self.stats.fraction('<', 1), 0.9, delta=0.05)
+
+    def testEqualFrequentValue(self):
+        self.assertAlmostEqual(self.stats.fraction('=', 0), 0.9, delta=0.05)
+
+    def testRangesAddUp(self):
+        for value in [0, 1, 50, 100]:
+            total = sum(self.stats.fraction(delim, value) for delim in '<=>')
+            self.assertAlmostEqual(total, 1.0, delta=0.1)
+
+if __name__ == '__main__':
+    unittest.main()
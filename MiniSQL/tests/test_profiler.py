@@ -0,0 +1,49 @@
+######################################
+# MiniSQL - Profiler tests           #
+######################################
+
+# Library imports
+import os
+import shutil
+import tempfile
+import unittest
+
+# Package imports
+from log import setLogLevel
+from miniSql import Database
+from profiler import SLOW_LOG_FILE
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'databases')
+
+class PerDatabaseTest(unittest.TestCase):
+    """
+    Two databases open in one process keep their own slow query log and counters.
+    """
+    def setUp(self):
+        setLogLevel('off')
+        self.root = tempfile.mkdtemp()
+        self.paths = [os.path.join(self.root, name) for name in ['first', 'second']]
+        for path in self.paths:
+            shutil.copytree(SAMPLE, path)
+        self.first, self.second = [Database(path) for path in self.paths]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def testSlowLog(self):
+        self.first.execute("set slow_query_ms 0;")
+        self.first.execute("select * from table1;")
+        self.second.execute("select * from table1;")
+        self.assertTrue(os.path.isfile(os.path.join(self.paths[0], SLOW_LOG_FILE)))
+        self.assertFalse(os.path.isfile(os.path.join(self.paths[1], SLOW_LOG_FILE)))
+        self.assertEqual(len(self.second.slow_log.entries), 0)
+
+    def testCounters(self):
+        self.first.execute("select * from table1;")
+        self.first.execute("select * from table2;")
+        self.assertEqual(self.first.counters()['queries'], 2)
+        self.assertEqual(self.second.counters()['queries'], 0)
+        self.assertEqual(self.first.counters()['load_rows'], self.second.counters()['load_rows'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+######################################
+# MiniSQL - Write-ahead log tests    #
+######################################
+
+# Library imports
+import os
+import shutil
+import tempfile
+import unittest
+
+# Package imports
+from wal import WriteAheadLog, WAL_FILE, encodeRecord
+from log import setLogLevel
+from miniSql import Database, Session
+from results import QueryError
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'databases')
+
+class TornTailTest(unittest.TestCase):
+    """
+    A crash in the middle of a commit leaves a torn tail, reopening must cut it so later commits replay.
+    """
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, WAL_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def commit(self, wal, row):
+        wal.append('insert', 'table1', rows=[row])
+        wal.commit()
+
+    def replayed(self):
+        return [record['rows'] for record in WriteAheadLog(self.path).records()]
+
+    def testTornRecord(self):
+        self.commit(WriteAheadLog(self.path), [1])
+        end = os.path.getsize(self.filename)
+        with open(self.filename,'a') as f:
+            f.write('0badc0de {"op": "ins')
+        wal = WriteAheadLog(self.path)
+        self.assertEqual(os.path.getsize(self.filename), end)
+        self.commit(wal, [2])
+        self.assertEqual(self.replayed(), [[[1]], [[2]]])
+
+    def testUncommittedTail(self):
+        self.commit(WriteAheadLog(self.path), [1])
+        crashed = WriteAheadLog(self.path)
+        crashed.append('insert', 'table1', rows=[[9]])
+        with open(self.filename,'a') as f:
+            f.write(''.join(encodeRecord(record) for record in crashed.pending))
+        wal = WriteAheadLog(self.path)
+        self.commit(wal, [2])
+        self.assertEqual(self.replayed(), [[[1]], [[2]]])
+
+    def testCleanLogUntouched(self):
+        wal = WriteAheadLog(self.path)
+        self.commit(wal, [1])
+        self.commit(wal, [2])
+        size = os.path.getsize(self.filename)
+        self.assertEqual(self.replayed(), [[[1]], [[2]]])
+        self.assertEqual(os.path.getsize(self.filename), size)
+
+class OpenBatchCheckpointTest(unittest.TestCase):
+    """
+    Writes of a batch that never commits stay out of the table files whatever other sessions run.
+    """
+    def setUp(self):
+        setLogLevel('off')
+        self.path = os.path.join(tempfile.mkdtemp(), 'db')
+        shutil.copytree(SAMPLE, self.path)
+        self.database = Database(self.path)
+        self.session = Session()
+        self.database.execute("begin;", session=self.session)
+        self.database.execute("insert into table1 values (7,7,7);", session=self.session)
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def reopened(self):
+        # The first Database is dropped without closing, as after a crash.
+        return Database(self.path).execute("select count(*) from table1 where A=7;").rows[0][0]
+
+    def testCheckpointDeferred(self):
+        self.database.execute("insert into table1 values (8,8,8);")
+        self.database.execute("checkpoint;")
+        self.assertEqual(self.reopened(), 0)
+        self.assertEqual(Database(self.path).execute("select count(*) from table1 where A=8;").rows[0][0], 1)
+
+    def testFileRewritesRefused(self):
+        self.assertRaises(QueryError, self.database.execute, "create table t3 (x INT);")
+        self.assertRaises(QueryError, self.database.execute, "convert table1 to binary;")
+        self.assertEqual(self.reopened(), 0)
+
+    def testCommittedAfterCheckpoint(self):
+        self.database.execute("checkpoint;")
+        self.database.execute("commit;", session=self.session)
+        self.database.execute("checkpoint;")
+        self.assertEqual(self.reopened(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
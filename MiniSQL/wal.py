@@ -0,0 +1,205 @@
+######################################
+# MiniSQL - Write-ahead log          #
+######################################
+
+# Library imports
+import os
+import json
+import zlib
+
+WAL_FILE = 'wal.log'
+CHECKPOINT_FILE = 'checkpoint.lsn'
+PENDING_FILE = 'checkpoint.pending'
+# Log size after which a commit triggers a checkpoint.
+CHECKPOINT_BYTES = 64 << 20
+
+def writeDurably(filename, content):
+    """
+    Replace a small file atomically : write it aside, fsync, rename over the old one.
+    """
+    with open(filename+'.tmp','w') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(filename+'.tmp', filename)
+    syncDirectory(os.path.dirname(filename) or '.')
+
+def syncDirectory(path):
+    """
+    fsync a directory so renames inside it survive a crash.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def encodeRecord(record):
+    payload = json.dumps(record, separators=(',',':'))
+    return '%08x %s\n' % (zlib.crc32(payload) & 0xffffffff, payload)
+
+def decodeRecord(line):
+    """
+    Decode a log line, None if it is torn or corrupt.
+    """
+    if not line.endswith('\n') or len(line) < 10:
+        return None
+    crc, payload = line[:8], line[9:-1]
+    try:
+        if int(crc, 16)!=zlib.crc32(payload) & 0xffffffff:
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+class WriteAheadLog(object):
+    """
+    Append-only log of INSERT/DELETE/TRUNCATE records for one database directory.
+    Records are buffered and written with a single fsync per commit (group commit),
+    a commit marker makes every commit all-or-nothing on replay. A BEGIN batch takes the
+    buffered records of its statements with release and commits them together.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.filename = path+'/'+WAL_FILE
+        self.pending = []
+        self.dirty = set()
+        self.commits = 0
+        self.checkpoint_lsn = readCheckpointLsn(path)
+        self.lsn = self.checkpoint_lsn
+        records, end = self.scan()
+        for record in records:
+            self.lsn = max(self.lsn, record['lsn'])
+            self.dirty.add(record['table'])
+        self.truncate(end)
+
+    def scan(self):
+        """
+        Committed records newer than the last checkpoint, in log order, and the offset just past
+        the last commit marker. Stops at the first torn record.
+        """
+        if not os.path.isfile(self.filename):
+            return [], 0
+        committed = []
+        uncommitted = []
+        end = 0
+        with open(self.filename,'r') as f:
+            while True:
+                line = f.readline()
+                record = decodeRecord(line)
+                if record is None:
+                    break
+                if record['op']=='commit':
+                    committed += uncommitted
+                    uncommitted = []
+                    end = f.tell()
+                elif record['lsn'] > self.checkpoint_lsn:
+                    uncommitted.append(record)
+        return committed, end
+
+    def records(self):
+        """
+        Committed records newer than the last checkpoint, in log order. Stops at the first torn record.
+        """
+        return self.scan()[0]
+
+    def truncate(self, end):
+        """
+        Cut the log after its last commit : a torn or uncommitted tail left by a crash would
+        otherwise sit in front of the next commits and hide them from replay.
+        """
+        if self.size() <= end:
+            return
+        with open(self.filename,'r+') as f:
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, op, table, **fields):
+        """
+        Buffer a record until the next commit.
+        """
+        self.lsn += 1
+        record = dict(fields, lsn=self.lsn, op=op, table=table)
+        self.pending.append(record)
+        self.dirty.add(table)
+        return record
+
+    def release(self):
+        """
+        Take the buffered records out of the log, to be committed later with commit(records).
+        """
+        records, self.pending = self.pending, []
+        return records
+
+    def commit(self, records=None):
+        """
+        Write every buffered record, or the released records given, plus a commit marker and
+        fsync once. Returns the number of records.
+        """
+        buffered = records is None
+        if buffered:
+            records = self.pending
+        if not records:
+            return 0
+        data = ''.join(encodeRecord(record) for record in records)+encodeRecord({'op':'commit'})
+        with open(self.filename,'a') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if buffered:
+            self.pending = []
+        self.commits += 1
+        return len(records)
+
+    def size(self):
+        return os.path.getsize(self.filename) if os.path.isfile(self.filename) else 0
+
+    def needsCheckpoint(self):
+        return self.size() > CHECKPOINT_BYTES
+
+    def checkpoint(self, stage, install):
+        """
+        Fold the log into the table files. stage(table) writes a table aside and returns its
+        (staged, final) file names. install(table) runs once the new files are in place.
+        The renames are recorded in a pending file first, so a crash mid-way is finished on recovery.
+        """
+        self.commit()
+        if not self.dirty:
+            return []
+        tables = sorted(self.dirty)
+        renames = [stage(table) for table in tables]
+        writeDurably(self.path+'/'+PENDING_FILE, json.dumps({'lsn': self.lsn, 'renames': renames}))
+        finishCheckpoint(self.path)
+        for table in tables:
+            install(table)
+        self.checkpoint_lsn = self.lsn
+        self.dirty = set()
+        return tables
+
+def readCheckpointLsn(path):
+    if not os.path.isfile(path+'/'+CHECKPOINT_FILE):
+        return 0
+    with open(path+'/'+CHECKPOINT_FILE,'r') as f:
+        return int(f.read().strip() or 0)
+
+def finishCheckpoint(path):
+    """
+    Complete a checkpoint recorded in the pending file : move the staged table files into place,
+    advance the checkpoint LSN and empty the log. Does nothing if no checkpoint is pending.
+    """
+    pending_file = path+'/'+PENDING_FILE
+    if not os.path.isfile(pending_file):
+        return False
+    with open(pending_file,'r') as f:
+        pending = json.loads(f.read())
+    for staged, final in pending['renames']:
+        if os.path.isfile(staged):
+            os.rename(staged, final)
+    syncDirectory(path)
+    writeDurably(path+'/'+CHECKPOINT_FILE, str(pending['lsn']))
+    with open(path+'/'+WAL_FILE,'w') as f:
+        os.fsync(f.fileno())
+    os.remove(pending_file)
+    syncDirectory(path)
+    return True
@@ -0,0 +1,154 @@
+######################################
+# MiniSQL - Zone maps                #
+######################################
+
+# Library imports
+import os
+import numpy as np
+
+# Rows per block summarized by a zone map.
+ZONE_ROWS = 16384
+ZONE_EXT = '.zmap'
+
+INT64_MIN = np.iinfo(np.int64).min
+INT64_MAX = np.iinfo(np.int64).max
+
+class ZoneMap(object):
+    """
+    Min, max and NULL count of every block of ZONE_ROWS rows of a column. Blocks holding only
+    NULLs get an empty range so no comparison can match them.
+    """
+    def __init__(self, mins=None, maxs=None, nulls=None, rows=0):
+        self.mins = np.zeros(0, dtype=np.int64) if mins is None else mins
+        self.maxs = np.zeros(0, dtype=np.int64) if maxs is None else maxs
+        self.nulls = np.zeros(0, dtype=np.int64) if nulls is None else nulls
+        self.rows = rows
+
+    def summarize(self, column, first_block):
+        """
+        Recompute the blocks from first_block to the end of the column.
+        """
+        start = first_block*ZONE_ROWS
+        values, valid = column.slice(start)
+        starts = np.arange(0, len(values), ZONE_ROWS)
+        if len(values):
+            mins = np.minimum.reduceat(np.where(valid, values, INT64_MAX), starts)
+            maxs = np.maximum.reduceat(np.where(valid, values, INT64_MIN), starts)
+            nulls = np.add.reduceat((~valid).astype(np.int64), starts)
+        else:
+            mins = maxs = nulls = np.zeros(0, dtype=np.int64)
+        self.mins = np.concatenate([self.mins[:first_block], mins])
+        self.maxs = np.concatenate([self.maxs[:first_block], maxs])
+        self.nulls = np.concatenate([self.nulls[:first_block], nulls])
+        self.rows = len(column)
+
+    def appended(self, column):
+        """
+        Follow an append : only the last partial block and the new ones change.
+        """
+        self.summarize(column, self.rows // ZONE_ROWS)
+
+    def deleted(self, column):
+        """
+        Follow a delete : rows shift towards the start, every block is summarized again.
+        """
+        self.summarize(column, 0)
+
+    def mayMatch(self, delim, value):
+        """
+        Boolean mask of the blocks that may hold a value satisfying `column <delim> value`.
+        """
+        if delim=='=':
+            return (self.mins <= value) & (self.maxs >= value)
+        if delim=='<':
+            return self.mins < value
+        if delim=='>':
+            return self.maxs > value
+        raise ValueError("Unsupported operator %s" % delim)
+
+def buildZoneMap(column):
+    zones = ZoneMap()
+    zones.summarize(column, 0)
+    return zones
+
+def candidateBlocks(table, groups):
+    """
+    Mask of the blocks of a table that may hold rows matching OR-ed groups of AND-ed
+    (column, operator, value) conditions. None if some group has no condition on the table.
+    """
+    blocks = None
+    for group in groups:
+        group_blocks = None
+        for col, delim, value in group:
+            zones = table[col].zones
+            if zones is None or zones.rows!=len(table[col]):
+                zones = table[col].zones = buildZoneMap(table[col])
+            hit = zones.mayMatch(delim, value)
+            group_blocks = hit if group_blocks is None else group_blocks & hit
+        if group_blocks is None:
+            # A group that can not be checked may match anywhere.
+            return None
+        blocks = group_blocks if blocks is None else blocks | group_blocks
+    return blocks
+
+def blockRanges(blocks, rows):
+    """
+    Turn a block mask into (start, stop) row ranges, merging neighbouring blocks.
+    """
+    padded = np.concatenate([[False], blocks, [False]])
+    edges = np.flatnonzero(padded[1:]!=padded[:-1])
+    return [(int(start)*ZONE_ROWS, min(int(stop)*ZONE_ROWS, rows)) for start, stop in zip(edges[::2], edges[1::2])]
+
+def tableFingerprint(path, t_name):
+    """
+    Size and modification time of a table's data file, a zone map is only trusted for the file it was built from.
+    """
+    for ext in ['.mtbl', '.csv']:
+        if os.path.isfile(path+'/'+t_name+ext):
+            stat = os.stat(path+'/'+t_name+ext)
+            return np.array([stat.st_size, int(stat.st_mtime*1e6)], dtype=np.int64)
+    return np.zeros(2, dtype=np.int64)
+
+def saveZoneMaps(path, t_name, table):
+    """
+    Persist the zone maps of every column of a table in one file next to the table.
+    """
+    arrays = {'__source__': tableFingerprint(path, t_name)}
+    for col, column in table.items():
+        if column.zones is None:
+            continue
+        arrays[col+'.min'] = column.zones.mins
+        arrays[col+'.max'] = column.zones.maxs
+        arrays[col+'.nulls'] = column.zones.nulls
+        arrays[col+'.rows'] = np.array([column.zones.rows], dtype=np.int64)
+    with open(path+'/'+t_name+ZONE_EXT,'wb') as f:
+        np.savez(f, **arrays)
+
+def loadZoneMaps(path, database):
+    """
+    Attach a zone map to every column. Persisted maps are reused when they were built from the current
+    table file and still cover the column, otherwise the table is summarized again and saved.
+    """
+    for t_name, table in database.items():
+        saved = None
+        if os.path.isfile(path+'/'+t_name+ZONE_EXT):
+            with open(path+'/'+t_name+ZONE_EXT,'rb') as f:
+                saved = dict(np.load(f).items())
+            if not np.array_equal(saved['__source__'], tableFingerprint(path, t_name)):
+                saved = None
+        rebuilt = False
+        for col, column in table.items():
+            if saved is not None and col+'.rows' in saved and int(saved[col+'.rows'][0])==len(column):
+                column.zones = ZoneMap(saved[col+'.min'], saved[col+'.max'], saved[col+'.nulls'], len(column))
+            else:
+                column.zones = buildZoneMap(column)
+                rebuilt = True
+        if rebuilt and table:
+            saveZoneMaps(path, t_name, table)
+
+def invalidateZoneMaps(path, t_name):
+    """
+    Remove the persisted zone maps of a table whose file is about to change.
+    """
+    if os.path.isfile(path+'/'+t_name+ZONE_EXT):
+        os.remove(path+'/'+t_name+ZONE_EXT)